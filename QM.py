@@ -1,19 +1,20 @@
 import ipywidgets as widgets
 from IPython.display import HTML, display
 import time
-import threading
 import os
 import importlib
-from qm import QuantumMachinesManager
+import uuid
+import traceback
+import asyncio
+from collections import deque
+from concurrent import futures
 import zmq
-
-QM_Router_IP = "129.175.113.167"
-cluster_name = "Cluster_1"
-
-# QM address
-QM_Router_IP = "129.175.113.167"
-cluster_name = "Cluster_1"
-qmm = QuantumMachinesManager(host=QM_Router_IP, cluster_name=cluster_name, log_level="ERROR",) 
+from QM_session import session, QM_Router_IP, cluster_name
+from QM_jobtable import JobTable, recv_all
+from QM_async import JobManager
+from QM_fetch import StreamFetcher
+from QM_archive import ArchiveWriter, program_text
+from QM_cache import ResultCache
 
 # Local address for queue monitoring
 host = "127.0.0.1"
@@ -23,14 +24,75 @@ context = zmq.Context()
 socket = context.socket(zmq.PUB)
 socket.connect(f"tcp://{host}:{port1}")
 
+def __getattr__(name):
+    # QM.qmm is kept for notebooks, it connects on first access
+    if name == "qmm":
+        return session.qmm
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+manager = None
+
+def get_manager():
+    """JobManager monitoring the jobs of this kernel, started on first use"""
+    global manager
+    if manager is None:
+        manager = JobManager(context, f"tcp://{host}:{port2}")
+    return manager
+
+def send_job_status(status, job_id, qm_id, token=None):
+    """Announce a job event (pending, running, finished, halted or canceled) to the QueueMonitor"""
+    msg = {"status":status, "time": time.time(), "user":os.environ["JUPYTERHUB_USER"], "id":job_id, "qm_id":qm_id}
+    if token:
+        msg["token"] = token
+    socket.send_string("JOB", flags=zmq.SNDMORE)
+    socket.send_json(msg)
+
+def wait_for_slot(estimate, timeout=30., resubmit=5.):
+    """Ask the QueueMonitor broker for a slot on the OPX and block until it is granted.
+
+    estimate is the expected run time of the job in seconds.
+    The submission is sent again every resubmit seconds, the first messages can be lost while
+    the subscription is set up. The broker acknowledges each of them, a TimeoutError is raised
+    if it stays silent for timeout seconds, e.g. when no QueueMonitor is running.
+    Returns the token identifying the job for the broker."""
+    token = uuid.uuid4().hex
+    socket_grant = context.socket(zmq.SUB)
+    socket_grant.connect(f"tcp://{host}:{port2}")
+    socket_grant.subscribe("GRANT")
+    msg = {"token":token, "user":os.environ["JUPYTERHUB_USER"], "estimate":estimate}
+    print("Waiting for a slot from the broker...", end="\r")
+    last_sent = 0.
+    last_heard = time.time()
+    try:
+        while True:
+            now = time.time()
+            if now-last_heard > timeout:
+                raise TimeoutError("No answer from the broker, is a QueueMonitor running?")
+            if now-last_sent > resubmit:
+                socket.send_string("SUBMIT", flags=zmq.SNDMORE)
+                socket.send_json(msg)
+                last_sent = now
+            if socket_grant.poll(timeout=1000):
+                for topic, grant in recv_all(socket_grant):
+                    if grant["token"]==token:
+                        last_heard = time.time()
+                        if grant.get("rejected"):
+                            raise RuntimeError("Submission rejected by the broker, too many jobs waiting")
+                        if not grant.get("queued"):
+                            return token
+    except (KeyboardInterrupt, TimeoutError):
+        socket.send_string("WITHDRAW", flags=zmq.SNDMORE)
+        socket.send_json(msg)
+        raise
+    finally:
+        socket_grant.close()
+
 def get_config(full=False):
     """Return configuration dictionary of the current QM.
 
     Optional argument:
     full=False : if False, only LO and IF parameters are returned"""
-    qm_list = qmm.list_open_qms()
-    qm = qmm.get_qm(qm_list[0])
-    config = qm.get_config()
+    config = session.call_qm(lambda qm: qm.get_config())
     if full:
         return config
     out = dict()
@@ -44,9 +106,7 @@ def get_config(full=False):
 def show_config():
     """Display the configuration of the current QM."""
     try:
-        qm_list = qmm.list_open_qms()
-        qm = qmm.get_qm(qm_list[0])
-        config = qm.get_config()
+        qm, config = session.call_qm(lambda qm: (qm, qm.get_config()))
     except:
         return "Could not find running QM"
     s = f"<h2>Configuration of {qm.id}</h2><h3>Elements</h3><ul>"
@@ -70,31 +130,78 @@ def show_config():
     s += "</ul>"
     return HTML(s)
 
-class Job(threading.Thread):
-    def __init__(self, qmprog, blocking=False):
-        """Create a QM job from a QUA program with interactive monitoring"""
-        self.output = widgets.Output()
-        qm_list =  qmm.list_open_qms()
-        qm = qmm.get_qm(qm_list[0])
-        self.output.append_stdout(f"Sending job to {qm.id}...")
-        self.job = qm.queue.add(qmprog)
-        while self.job.status=="loading":
-            time.sleep(0.1)
-        super().__init__()
-        self.output.append_stdout("loaded\n")
-        self.qm = qm
+class Job:
+    def __init__(self, qmprog, blocking=False, estimate=None, stream=(), stream_dir=None, archive=None, axes=None):
+        """Create a QM job from a QUA program with interactive monitoring
+
+        The job is monitored by the JobManager of the kernel, together with the other jobs.
+        The stages of the job are concurrent futures: loaded, running (None if the job never ran),
+        done (the final status) and processed (all results are available).
+        In a coroutine, use await asyncio.wrap_future(job.done).
+
+        Optional arguments:
+        blocking=False : if True, wait until the job is over
+        estimate=None : expected run time in seconds, if given the job waits for a slot from the fair-share broker
+        stream=() : names of save_all results fetched in chunks while the job runs
+        stream_dir=None : if given, the streamed results are memory-mapped files in this directory
+        archive=None : directory where the results are archived, see QM_archive.Archive to read it back
+        axes=None : dictionary of the sweep axes stored in the archive"""
+        # The archive directory is created first, an existing one fails before the job is queued.
+        # It is removed if the submission fails, so that the cell can be run again.
+        self.archive = None
+        if archive:
+            self.archive = ArchiveWriter(archive, axes, program=program_text(qmprog), config=get_config(full=True),
+                                         user=os.environ["JUPYTERHUB_USER"])
+        try:
+            self.token = wait_for_slot(estimate) if estimate is not None else None
+            self.output = widgets.Output()
+            self.submitted = time.time()
+            self.qm, self.job = session.call_qm(lambda qm: (qm, qm.queue.add(qmprog)))
+        except BaseException:
+            if self.archive:
+                self.archive.discard()
+            raise
+        if self.archive:
+            self.archive.meta.update(job_id=self.job.id, qm_id=self.qm.id)
+            self.archive.write_meta()
+        self.stream = stream
+        self.stream_dir = stream_dir
+        self.fetchers = {}
+        # Once the job is over, seconds between the start and the end of the run, and between the
+        # submission and the end without the time waited behind other jobs (compilation and loading included)
+        self.started = None
+        self.waited = 0.
+        self.run_time = None
+        self.total_time = None
+        self.output.append_stdout(f"Job sent to {self.qm.id}...")
+        self.loaded = futures.Future()
+        self.running = futures.Future()
+        self.done = futures.Future()
+        self.processed = futures.Future()
         self.button_abort = widgets.Button(description='Abort')
         self.button_abort.on_click(self.abort_clicked)
         self.job_table = widgets.HTML(value = "")
+        self.jobtable = JobTable()
         self.show()
         self.abort = False
-        self.start()
+        # Exception raised while following the job, None if all went well
+        self.error = None
+        get_manager().watch(self)
         if blocking:
             self.join()
 
     def get_results(self,*args):
-        handles = [self.job.result_handles.get(arg) for arg in args]
-        return tuple(h.fetch_all(flat_struct=True) for h in handles)
+        self.loaded.result()
+        return tuple(self.fetchers[arg].result() if arg in self.fetchers and self.processed.done()
+                     else self.job.result_handles.get(arg).fetch_all(flat_struct=True) for arg in args)
+
+    def results(self,*args):
+        """Concurrent future of get_results(*args), resolved once all results are available"""
+        manager = get_manager()
+        async def fetch():
+            await asyncio.wrap_future(self.processed)
+            return await manager.call(self.get_results, *args)
+        return asyncio.run_coroutine_threadsafe(fetch(), manager.loop)
             
     def show(self):
         display(self.button_abort, self.output, self.job_table)
@@ -105,9 +212,12 @@ class Job(threading.Thread):
     def __getattr__(self, attr):
         return getattr(self.job,attr)
 
-    def display(self, table):
+    def display(self, msgs):
+        """Apply JOBTABLE messages and render the job table if it changed"""
+        if not self.jobtable.apply_all(msgs):
+            return
         out = "<em>QM job list:</em><table>"
-        for job in table:
+        for job in self.jobtable.table:
             waiting_time = f"{time.time()-job["time"]:.0f}" if job["time"] else "??"
             if job["id"]==self.job.id:
                 out += f"""<tr><td><b>{job["status"].capitalize()}</b></td><td><b>{job["id"]}</b></td><td><b>{job["user"] or os.environ["JUPYTERHUB_USER"]}</td><td><b>{waiting_time}s</b></td></tr>"""
@@ -116,85 +226,187 @@ class Job(threading.Thread):
         out += "</table>"
         self.job_table.value = out
 
-    def run(self):
-        poller = zmq.Poller()
-        socket_info = context.socket(zmq.SUB)
-        socket_info.connect(f"tcp://{host}:{port2}")
-        socket_info.subscribe("JOBTABLE")
-        poller.register(socket_info, zmq.POLLIN)
-        if self.job.status=="pending":
-            status = {"status":"pending", "time": time.time(), "user":os.environ["JUPYTERHUB_USER"], "id":self.job.id, "qm_id":self.qm.id}
-            socket.send_string("JOB", flags=zmq.SNDMORE)
-            socket.send_json(status)
-        while self.job.status=="pending":
-            self.output.append_stdout(f"Position in queue {self.job.position_in_queue()} \r")
-            evts = dict(poller.poll(timeout=200))
-            if socket_info in evts:
-                topic = socket_info.recv_string()
-                jobtable = socket_info.recv_json()
-                self.display(jobtable)
-            if self.abort:
-                self.job.cancel()
-                self.output.append_stdout("Job has been canceled\n")
-                self.job_table.value = ""
-                return
+    async def lifecycle(self, manager):
+        """Follow the job until it is over, run by the JobManager"""
+        manager.jobs.add(self)
         try:
-            self.job = self.job.wait_for_execution(timeout=2)
-        except:
-            self.output.append_stdout("Job has been canceled\n")
-            self.job_table.value = ""
-            return            
-        if self.job.status=="running":
-            self.output.append_stdout("Job is running...               \n")
-            status = {"status":"running", "time": time.time(), "user":os.environ["JUPYTERHUB_USER"], "id":self.job.id, "qm_id":self.qm.id}
-            socket.send_string("JOB", flags=zmq.SNDMORE)
-            socket.send_json(status)
-        while self.job.status=="running":
-            evts = dict(poller.poll(timeout=200))
-            if socket_info in evts:
-                topic = socket_info.recv_string()
-                jobtable = socket_info.recv_json()
-                self.display(jobtable)
-            if self.abort:
-                self.job.halt()
-                self.output.append_stdout("Job has been halted\n")
-                self.job_table.value = ""
-                return
-        self.output.append_stdout("Job has finished\n")
+            status = await manager.call(getattr, self.job, "status")
+            while status=="loading":
+                await asyncio.sleep(0.1)
+                status = await manager.call(getattr, self.job, "status")
+            self.output.append_stdout("loaded\n")
+            self.loaded.set_result(self)
+            if status=="pending":
+                send_job_status("pending", self.job.id, self.qm.id, self.token)
+            pending_since = time.time()
+            while status=="pending":
+                position = await manager.call(self.job.position_in_queue)
+                self.output.append_stdout(f"Position in queue {position} \r")
+                if self.abort:
+                    await manager.call(self.job.cancel)
+                    return self.finish("canceled", "Job has been canceled\n")
+                await asyncio.sleep(manager.pending_period)
+                status = await manager.call(getattr, self.job, "status")
+            self.waited = time.time() - pending_since
+            try:
+                self.job = await manager.call(lambda: self.job.wait_for_execution(timeout=2))
+            except:
+                return self.finish("canceled", "Job has been canceled\n")
+            for name in self.stream:
+                path = os.path.join(self.stream_dir, f"{self.job.id}_{name}.dat") if self.stream_dir else None
+                on_chunk = (lambda chunk, name=name: self.archive.append(name, chunk)) if self.archive else None
+                self.fetchers[name] = StreamFetcher(self.job.result_handles.get(name), path=path, on_chunk=on_chunk)
+            status = await manager.call(getattr, self.job, "status")
+            if status=="running":
+                self.output.append_stdout("Job is running...               \n")
+                send_job_status("running", self.job.id, self.qm.id, self.token)
+                self.started = time.time()
+                self.running.set_result(self)
+            while status=="running":
+                await asyncio.sleep(manager.period)
+                for fetcher in self.fetchers.values():
+                    await manager.call(fetcher.poll)
+                if self.abort:
+                    await manager.call(self.job.halt)
+                    return self.finish("halted", "Job has been halted\n")
+                status = await manager.call(getattr, self.job, "status")
+            self.finish("finished", "Job has finished\n")
+            await manager.call(self.job.result_handles.wait_for_all_values)
+            for fetcher in self.fetchers.values():
+                await manager.call(fetcher.poll)
+            if self.archive:
+                await manager.call(self.archive_results)
+        except Exception as exc:
+            self.error = exc
+            self.output.append_stderr("".join(traceback.format_exception(exc)))
+            raise
+        finally:
+            manager.jobs.discard(self)
+            # Stages the job never reached
+            for stage, value in ((self.loaded, self), (self.running, None), (self.done, "error"), (self.processed, self)):
+                if not stage.done():
+                    stage.set_result(value)
+
+    def archive_results(self):
+        """Store the results that were not streamed to the archive"""
+        for name in self.job.result_handles.keys():
+            if name not in self.fetchers:
+                self.archive.save(name, self.job.result_handles.get(name).fetch_all(flat_struct=True))
+
+    def finish(self, status, message):
+        if self.started:
+            self.run_time = time.time() - self.started
+            self.total_time = time.time() - self.submitted - self.waited
+        send_job_status(status, self.job.id, self.qm.id, self.token)
+        self.output.append_stdout(message)
         self.job_table.value = ""
+        self.done.set_result(status)
+        return status
+
+    def join(self, timeout=None):
+        """Wait until the job is over"""
+        futures.wait([self.done], timeout)
+
+    def is_alive(self):
+        return not self.done.done()
 
     def wait(self):
-        result_handles = self.job.result_handles
-        while result_handles.is_processing():
-            time.sleep(0.5)
+        """Wait until all results are available, raise the error that stopped the monitoring if any"""
+        self.processed.result()
+        if self.error:
+            raise self.error
+
+result_cache = None
+
+def run_cached(qmprog, *names, force=False, **kwargs):
+    """Run a QUA program and return its results names, reusing the results of an identical earlier job.
+
+    The cache is keyed by the QUA script and the current QM configuration, see QM_cache.ResultCache.
+    Optional arguments:
+    force=False : if True, measure again and replace the stored results
+    other keyword arguments are passed to Job"""
+    global result_cache
+    if result_cache is None:
+        result_cache = ResultCache()
+    key = result_cache.key(program_text(qmprog), get_config(full=True))
+    results = None if force else result_cache.get(key, names)
+    if results is not None:
+        print("Results loaded from the cache, use force=True to measure again")
+        return results
+    job = Job(qmprog, blocking=True, **kwargs)
+    job.wait()
+    results = job.get_results(*names)
+    if job.done.result()=="finished":
+        result_cache.put(key, names, results)
+    return results
+
+def run_pipeline(programs, *names, factory=None, callback=None, depth=2, **kwargs):
+    """Run a sequence of QUA programs back to back and return the list of their results names.
+
+    Up to depth jobs are kept in the queue: job k+1 is compiled and loaded while job k runs,
+    so that the OPX does not wait between jobs.
+    Optional arguments:
+    factory=None : if given, programs are parameter sets and the programs are built by factory,
+                   called with a dict as keyword arguments, a tuple as positional arguments, anything else as single argument.
+                   If the factory returns a tuple, the program is its first item.
+    callback=None : called with (index, item, results) as soon as each job is over
+    other keyword arguments are passed to Job"""
+    items = iter(enumerate(programs))
+    in_flight = deque()
+    def submit():
+        try:
+            index, item = next(items)
+        except StopIteration:
+            return False
+        qmprog = item
+        if factory:
+            out = factory(**item) if isinstance(item, dict) else factory(*item) if isinstance(item, tuple) else factory(item)
+            qmprog = out[0] if isinstance(out, tuple) else out
+        in_flight.append((index, item, Job(qmprog, **kwargs)))
+        return True
+    while len(in_flight)<depth and submit():
+        pass
+    results = []
+    while in_flight:
+        index, item, job = in_flight[0]
+        # Top up the queue as soon as the head job runs
+        job.running.result()
+        while len(in_flight)<depth and submit():
+            pass
+        job.wait()
+        in_flight.popleft()
+        out = job.get_results(*names)
+        results.append(out)
+        if callback:
+            callback(index, item, out)
+    return results
 
 class JobSimple:
-    def __init__(self, qmprog):
-        """Create a QM job from a QUA program"""
-        qm_list =  qmm.list_open_qms()
-        qm = qmm.get_qm(qm_list[0])
-        print(f"Sending job to {qm.id}")
+    def __init__(self, qmprog, estimate=None):
+        """Create a QM job from a QUA program
+
+        Optional argument:
+        estimate=None : expected run time in seconds, if given the job waits for a slot from the fair-share broker"""
+        self.token = wait_for_slot(estimate) if estimate is not None else None
         # Send the QUA program to the OPX, which compiles and executes it
-        self.job = qm.queue.add(qmprog)
+        qm, self.job = session.call_qm(lambda qm: (qm, qm.queue.add(qmprog)))
+        print(f"Job sent to {qm.id}")
         # Wait for job to be loaded
         while self.job.status=="loading":
             print("Job is loading...")
             time.sleep(0.1)
         # Wait until job is running
         time.sleep(0.1)
-        status = {"status":"pending", "time": time.time(), "user":os.environ["JUPYTERHUB_USER"], "id":self.job.id, "qm_id":qm.id}
-        socket.send_string("JOB", flags=zmq.SNDMORE)
-        socket.send_json(status)
+        send_job_status("pending", self.job.id, qm.id, self.token)
         while self.job.status=="pending":
             q = self.job.position_in_queue()
             if q>0:
                 print(job.id,"Position in queue",q,end='\r')
             time.sleep(0.1)
         self.job=self.job.wait_for_execution()
+        self.qm = qm
         print(f"\nJob {self.job.id} is running")
-        status = {"status":"running", "time": time.time(), "user":os.environ["JUPYTERHUB_USER"], "id":self.job.id, "qm_id":qm.id}
-        socket.send_string("JOB", flags=zmq.SNDMORE)
-        socket.send_json(status)
+        send_job_status("running", self.job.id, qm.id, self.token)
     
     def get_results(self,*args):
         handles = [self.job.result_handles.get(arg) for arg in args]
@@ -207,6 +419,7 @@ class JobSimple:
         result_handles = self.job.result_handles
         while result_handles.is_processing():
             time.sleep(0.5)
+        send_job_status("finished", self.job.id, self.qm.id, self.token)
         print("Job finished")
         
         
@@ -4,13 +4,18 @@ import time
 import threading
 import os
 import importlib
-from qm import QuantumMachinesManager
 import zmq
+from QM_session import session, QM_Router_IP, cluster_name
+from QM_jobtable import JobTablePublisher, recv_all
+from QM_registry import JobRegistry
+from QM_history import JobHistory
+from QM_broker import FairShareScheduler
+from QM_config import compare, format_diff
+from QM_calplan import calibration_plan
+from QM_waveforms import compile_waveforms, waveform_samples
 
-# QM address
-QM_Router_IP = "129.175.113.167"
-cluster_name = "Cluster_1"
-qmm = QuantumMachinesManager(host=QM_Router_IP, cluster_name=cluster_name, log_level="ERROR", octave_calibration_db_path=os.getcwd()) 
+# Octave calibrations are stored next to the notebooks
+session.configure(octave_calibration_db_path=os.getcwd())
 
 # Local address for queue monitoring
 host = "127.0.0.1"
@@ -22,37 +27,77 @@ try:
     socket2.bind(f"tcp://{host}:{port2}")
 except:
     socket2 = None
+
+def __getattr__(name):
+    # QMM.qmm is kept for notebooks, it connects on first access
+    if name == "qmm":
+        return session.qmm
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
     
 class QMloader:
     def __init__(self):
         self.button_reload = widgets.Button(description="Reload QM")
         self.button_calibrate = widgets.Button(description="Calibrate QM")
         self.dropdown_config = widgets.Dropdown(options=['config_00','config_qubit',],value='config_00',description='Config:')
+        self.checkbox_full = widgets.Checkbox(value=False, description='Full calibration')
+        # Calibrations older than this (in seconds) are redone
+        self.max_age = 24*3600
         self.output = widgets.Output()
         self.button_reload.on_click(self.reload_qm)
         self.button_calibrate.on_click(self.calibrate_qm)
         self.show()
 
     def show(self):
-        display(widgets.HBox([self.dropdown_config, self.button_reload, self.button_calibrate]), self.output)
+        display(widgets.HBox([self.dropdown_config, self.button_reload, self.button_calibrate, self.checkbox_full]), self.output)
     
+    def open_qm(self, config):
+        """Open a QM with config, unless the running QM already has this configuration"""
+        try:
+            qm, live = session.call_qm(lambda qm: (qm, qm.get_config()))
+        except:
+            qm = None
+        if qm:
+            diff = compare(config, live)
+            if not diff:
+                self.output.append_stdout(f'{time.asctime()} Configuration unchanged, keeping QM {qm.id}\n')
+                return qm
+            self.output.append_stdout(f'Configuration changes:\n{format_diff(diff)}')
+        return session.open_qm(config)
+
+    def compile_config(self, config):
+        """Configuration with compacted waveforms, see QM_waveforms.compile_waveforms"""
+        compiled = compile_waveforms(config)
+        (n0, s0), (n1, s1) = waveform_samples(config), waveform_samples(compiled)
+        self.output.append_stdout(f'Waveforms: {n0} -> {n1}, arbitrary samples: {s0} -> {s1}\n')
+        return compiled
+
     def reload_qm(self,button):
         config = importlib.import_module(self.dropdown_config.value)
         importlib.reload(config)
-        qm = qmm.open_qm(config.config)
+        qm = self.open_qm(self.compile_config(config.config))
         self.output.append_stdout(f'{time.asctime()} QM is ready with id {qm.id}\n')
 
     def calibrate_qm(self,button):
         config = importlib.import_module(self.dropdown_config.value)
         importlib.reload(config)
-        qm = qmm.open_qm(config.config)
-        for k,v in config.calibration_tasks.items():
+        if self.checkbox_full.value:
+            tasks, skipped = config.calibration_tasks, []
+        else:
+            db_path = os.path.join(session.octave_calibration_db_path or os.getcwd(), "calibration_db.json")
+            tasks, skipped = calibration_plan(config.config, config.calibration_tasks, db_path, max_age=self.max_age)
+        for k,LO,IF,age in skipped:
+            self.output.append_stdout(f'Skipping {k} at {LO/1e6:.1f} + {IF/1e6:.1f} MHz, calibrated {age/3600:.1f} h ago\n')
+        compiled = self.compile_config(config.config)
+        qm = self.open_qm(compiled)
+        for k,v in tasks.items():
             for LO,IF_list in v.items():
                 for IF in IF_list:
                     self.output.append_stdout(f'Calibrating {k} at {LO/1e6:.1f} + {IF/1e6:.1f} MHz\n')
             qm.calibrate_element(k,v)
             self.output.append_stdout('Done\n')
-        qm = qmm.open_qm(config.config)
+        if tasks:
+            # Reopen to load the new calibrations
+            qm = session.open_qm(compiled)
         self.output.append_stdout(f'{time.asctime()} QM is ready with id {qm.id}\n')
 
 
@@ -86,24 +131,19 @@ class QueueMonitorSimple(threading.Thread):
     
     def kill(self,button):
         try:
-            qm_list = qmm.list_open_qms()
-            qm = qmm.get_qm(qm_list[0])
+            job = session.call_qm(lambda qm: qm.get_running_job())
         except:
-            qm = None
-        if qm:
-            job = qm.get_running_job()
-            if job:
-                job.halt()
+            job = None
+        if job:
+            job.halt()
     
     def parse_queue(self):
         try:
-            qm_list = qmm.list_open_qms()
-            qm = qmm.get_qm(qm_list[0])
+            qm, pending_jobs, job = session.call_qm(lambda qm: (qm, qm.queue.pending_jobs, qm.get_running_job()))
             self.QM_label.value = f"Jobs on {qm.id}"
             table = []
-            for job in reversed(qm.queue.pending_jobs):
-                table.append(f"""<tr><td>Pending</td><td>{job.id}</td></tr>""")
-            job = qm.get_running_job()
+            for job_ in reversed(pending_jobs):
+                table.append(f"""<tr><td>Pending</td><td>{job_.id}</td></tr>""")
             if job:
                 table.append(f"""<tr><td>Running</td><td>{job.id}</td></tr>""")
             rows = " ".join(table)
@@ -115,7 +155,12 @@ class QueueMonitorSimple(threading.Thread):
 __killtime__ = {"inf":1e10, "10s":10, "30s":30, "1min":60, "2min":120, "5min":300, }
 
 class QueueMonitor(threading.Thread):
-    def __init__(self):
+    def __init__(self, capacity=10000, history="job_history.sqlite", broker=True):
+        """Monitor the QM queue, keeping up to capacity job registrations from the clients
+
+        Optional arguments:
+        history="job_history.sqlite" : SQLite file where job events are stored, None to disable
+        broker=True : release the jobs submitted with an estimate one at a time by fair share"""
         super().__init__()
         self.button_stop = widgets.Button(description='Stop')
         self.button_kill = widgets.Button(description='Kill')
@@ -125,11 +170,19 @@ class QueueMonitor(threading.Thread):
         self.job_table = widgets.HTML(value="")
         self.output = widgets.Output()
         self.keeprunning = True
-        self.joblist = []
-        self.jobmax = 100
+        self.registry = JobRegistry(capacity)
+        self.broker = FairShareScheduler() if broker else None
+        self.grant = None
+        self.grant_timeout = 60
+        self.publisher = JobTablePublisher(socket2)
+        self.last_display = None
         self.socket1 = context.socket(zmq.SUB)
         self.socket1.bind(f"tcp://{host}:{port1}")
         self.socket1.subscribe("JOB")
+        self.socket1.subscribe("SUBMIT")
+        self.socket1.subscribe("WITHDRAW")
+        # Created once the port is bound, the fallback to QueueMonitorSimple must not leave a writer thread behind
+        self.history = JobHistory(history) if history else None
         self.button_stop.on_click(self.stop)
         self.button_kill.on_click(self.kill)
         self.show()
@@ -144,14 +197,18 @@ class QueueMonitor(threading.Thread):
         while self.keeprunning:
             evts = dict(poller.poll(timeout=200))
             if self.socket1 in evts:
-                topic = self.socket1.recv_string()
-                job = self.socket1.recv_json()
-                self.joblist.append(job)
-                if len(self.joblist)>self.jobmax:
-                    self.joblist.pop(0)
+                for topic, msg in recv_all(self.socket1):
+                    if topic=="JOB":
+                        self.register(msg)
+                    elif topic=="SUBMIT":
+                        self.submit(msg)
+                    elif topic=="WITHDRAW" and self.broker is not None:
+                        self.broker.withdraw(msg["token"])
             self.parse_queue()
             self.progress_bar.value = int(time.time()) % 60
         self.socket1.close()
+        if self.history:
+            self.history.close()
         self.output.append_stdout("Done\n")
         
     def stop(self,button):
@@ -159,19 +216,65 @@ class QueueMonitor(threading.Thread):
         
     def kill(self,button):
         try:
-            qm_list = qmm.list_open_qms()
-            qm = qmm.get_qm(qm_list[0])
+            job = session.call_qm(lambda qm: qm.get_running_job())
         except:
-            qm = None
-        if qm:
-            job = qm.get_running_job()
-            if job:
-                job.halt()
+            job = None
+        if job:
+            job.halt()
                 
+    def register(self, job):
+        self.registry.add(job)
+        if self.history:
+            self.history.record(job)
+        token = job.get("token")
+        if self.broker is not None and token:
+            if self.grant and self.grant[0]==token:
+                self.grant = None
+            if job["status"]=="running":
+                self.broker.started(token)
+            elif job["status"]!="pending":
+                self.broker.done(token)
+
+    def submit(self, request):
+        """Queue a submission and acknowledge it, resent submissions are acknowledged again
+
+        Without a broker, submissions are granted at once."""
+        if self.broker is None:
+            self.send_grant(request["token"])
+            return
+        accepted = self.broker.submit(request["token"], request["user"], request["estimate"])
+        self.send_grant(request["token"], rejected=not accepted, queued=accepted)
+
+    def send_grant(self, token, rejected=False, queued=False):
+        if socket2:
+            socket2.send_string("GRANT", flags=zmq.SNDMORE)
+            socket2.send_json({"token":token, "rejected":rejected, "queued":queued})
+
+    def dispatch(self, pending_jobs):
+        """Release the next brokered submission once the OPX queue is empty
+
+        The grant is sent again every second until the job holding its token is registered."""
+        if self.broker is None:
+            return
+        self.broker.expire(self.grant_timeout)
+        now = time.time()
+        if self.grant and now-self.grant[1]<self.grant_timeout:
+            token, granted, sent = self.grant
+            if now-sent >= 1:
+                self.send_grant(token)
+                self.grant = (token, granted, now)
+            return
+        if pending_jobs:
+            return
+        request = self.broker.release()
+        if request:
+            self.grant = (request["token"], now, now)
+            self.send_grant(request["token"])
+
     def search_job(self,job_id,qm_id,status):
-        for job in self.joblist:
-            if job_id==job['id'] and qm_id==job['qm_id'] and status==job['status']:
-                return job
+        job = self.registry.get(job_id,qm_id,status)
+        if job:
+            return job
         return {"status":status, "time": None, "user": None, "id":job_id, "qm_id":qm_id}
         
     @property
@@ -180,20 +283,21 @@ class QueueMonitor(threading.Thread):
         
     def parse_queue(self):
         try:
-            qm_list = qmm.list_open_qms()
-            qm = qmm.get_qm(qm_list[0])
+            qm, pending_jobs, running_job = session.call_qm(lambda qm: (qm, qm.queue.pending_jobs, qm.get_running_job()))
             self.QM_label.value = f"Jobs on {qm.id}"
-            table = [ self.search_job(job.id,qm.id,"pending") for job in reversed(qm.queue.pending_jobs) ]
-            running_job = qm.get_running_job()
+            table = [ self.search_job(job.id,qm.id,"pending") for job in reversed(pending_jobs) ]
+            self.dispatch(pending_jobs)
             if running_job:
                 job_entry = self.search_job(running_job.id,qm.id,"running")
                 table.append(job_entry)
                 if job_entry["time"] and (time.time()-job_entry['time'])>self.killtime:
                     running_job.halt()
-            self.display_table(table)
-            if socket2:
-                socket2.send_string("JOBTABLE", flags=zmq.SNDMORE)
-                socket2.send_json(table)
+                    if self.history:
+                        self.history.record(dict(job_entry, status="halted", time=time.time()))
+            changed = self.publisher.publish(table)
+            # Waiting times are shown in seconds, no need to redraw more often
+            if changed or int(time.time())!=self.last_display:
+                self.display_table(table)
         except:
             self.job_table.value = ""
             self.QM_label.value = "Error while connecting to the QM"
@@ -205,13 +309,14 @@ class QueueMonitor(threading.Thread):
             out += f"""<tr><td>{job["status"].capitalize()}</td><td>{job["id"]}</td><td>{job["user"] or "unknown"}</td><td>{waiting_time}s</td></tr>"""
         out += "</table>"
         self.job_table.value = out
+        self.last_display = int(time.time())
 
-def createQueueMonitor(*args):
+def createQueueMonitor(*args, **kwargs):
     try:
-        return QueueMonitor(*args)
+        return QueueMonitor(*args, **kwargs)
     except:
         print("Someone already is already listening, falling back to simple QueueMonitor")
-        return QueueMonitorSimple(*args)
+        return QueueMonitorSimple()
 
 
 
@@ -220,9 +325,7 @@ def get_config(full=False):
 
     Optional argument:
     full=False : if False, only LO and IF parameters are returned"""
-    qm_list = qmm.list_open_qms()
-    qm = qmm.get_qm(qm_list[0])
-    config = qm.get_config()
+    config = session.call_qm(lambda qm: qm.get_config())
     if full:
         return config
     out = dict()
@@ -236,9 +339,7 @@ def get_config(full=False):
 def show_config():
     """Display the configuration of the current QM."""
     try:
-        qm_list = qmm.list_open_qms()
-        qm = qmm.get_qm(qm_list[0])
-        config = qm.get_config()
+        qm, config = session.call_qm(lambda qm: (qm, qm.get_config()))
     except:
         return "Could not find running QM"
     s = f"<h2>Configuration of {qm.id}</h2><h3>Elements</h3><ul>"
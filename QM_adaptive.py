@@ -0,0 +1,142 @@
+import threading
+import time
+from concurrent import futures
+import numpy as np
+import QM_fit
+from QM_fetch import StreamFetcher
+
+
+def t1_fit(t):
+    """Fit of a LifeTime average, returns (T1, error)."""
+    def fit(Sz):
+        popt, perr = QM_fit.fit_exp(t, -Sz)
+        return popt[1], perr[1]
+    return fit
+
+
+def t2_fit(t, phase):
+    """Fit of a DephasingTime average (durations x phases), returns (T2, error)."""
+    def fit(Sz):
+        popt, perr = QM_fit.fit_phase(phase, Sz)
+        popt, perr = QM_fit.fit_exp(t, popt[:, 0], offset=False)
+        return popt[1], perr[1]
+    return fit
+
+
+class AdaptiveAverager:
+    def __init__(self, fit, target=0.02, budget=None, min_blocks=2, clock=time.monotonic):
+        """Running average of the blocks of an acquisition, with an early stop criterion.
+
+        fit(average) returns the value of the parameter of interest and its error. The acquisition
+        can stop once error/value is below target, or when budget seconds have passed."""
+        self.fit = fit
+        self.target = target
+        self.budget = budget
+        self.min_blocks = min_blocks
+        self.clock = clock
+        self.start = clock()
+        self.sum = 0.
+        self.blocks = 0
+        self.fitted = 0
+        self.value = self.error = None
+        self.reason = None
+
+    def add(self, chunk):
+        """Add blocks, the first dimension of chunk runs over the blocks."""
+        chunk = np.asarray(chunk, dtype=float)
+        self.sum = self.sum + chunk.sum(axis=0)
+        self.blocks += len(chunk)
+
+    @property
+    def mean(self):
+        """Average of the blocks, None before the first one."""
+        return self.sum / self.blocks if self.blocks else None
+
+    def check(self):
+        """Refit the average if new blocks arrived, return the reason to stop or None."""
+        if self.reason is None and self.blocks >= self.min_blocks and self.blocks > self.fitted:
+            self.fitted = self.blocks
+            try:
+                self.value, self.error = self.fit(self.mean)
+            except Exception:
+                self.value = self.error = None
+            if self.value and np.isfinite(self.error) and self.error < self.target * abs(self.value):
+                self.reason = "converged"
+        if self.reason is None and self.budget is not None and self.clock() - self.start > self.budget:
+            self.reason = "budget"
+        return self.reason
+
+
+def run_adaptive(job, name, averager, period=0.5):
+    """Feed the save_all stream name of job to averager and halt the job once averager.check() says so.
+
+    job is a QM.Job, the stream holds one average per block. Returns averager, whose reason is
+    None if the job ended on its own."""
+    if job.running.result() is None:
+        return averager
+    fetcher = StreamFetcher(job.job.result_handles.get(name), on_chunk=averager.add)
+    while not job.done.done():
+        fetcher.poll()
+        if averager.check():
+            job.abort = True
+            job.done.result()
+            return averager
+        time.sleep(period)
+    # The last blocks may still be in stream processing when the job is done
+    job.processed.result()
+    fetcher.poll()
+    averager.check()
+    return averager
+
+
+class SimulatedHandle:
+    def __init__(self):
+        self.blocks = []
+        self.lock = threading.Lock()
+
+    def count_so_far(self):
+        with self.lock:
+            return len(self.blocks)
+
+    def fetch(self, item, flat_struct=True):
+        with self.lock:
+            return np.array(self.blocks[item])
+
+
+class SimulatedJob:
+    def __init__(self, expectation, shots=200, blocks=50, block_time=0.01, name="Sz_blocks", seed=None):
+        """Stand-in for a QM.Job streaming block averages of single shots of +-0.5 with the given expectation.
+
+        Each block of shots takes block_time seconds. Like a QM.Job, it has running, done and processed
+        futures, result handles and an abort flag, for testing run_adaptive without a QM. As on the OPX,
+        the last block only reaches the stream after the job is done."""
+        self.expectation = np.asarray(expectation, dtype=float)
+        self.shots = shots
+        self.max_blocks = blocks
+        self.block_time = block_time
+        self.rng = np.random.default_rng(seed)
+        self.handle = SimulatedHandle()
+        self.job = self
+        self.result_handles = {name: self.handle}
+        self.abort = False
+        self.running = futures.Future()
+        self.done = futures.Future()
+        self.processed = futures.Future()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        self.running.set_result(self)
+        p = np.clip(self.expectation + 0.5, 0, 1)
+        for i in range(self.max_blocks):
+            time.sleep(self.block_time)
+            if self.abort:
+                self.done.set_result("halted")
+                self.processed.set_result(self)
+                return
+            block = self.rng.binomial(self.shots, p) / self.shots - 0.5
+            if i == self.max_blocks - 1:
+                self.done.set_result("finished")
+                time.sleep(self.block_time)
+            with self.handle.lock:
+                self.handle.blocks.append(block)
+        self.processed.set_result(self)
@@ -0,0 +1,80 @@
+import json
+import os
+import shutil
+import time
+import numpy as np
+
+
+def program_text(qmprog):
+    """QUA script of a program, empty if it cannot be serialized."""
+    from qm import generate_qua_script
+    try:
+        return generate_qua_script(qmprog)
+    except Exception:
+        return ""
+
+
+class ArchiveWriter:
+    def __init__(self, path, axes=None, program="", config=None, **info):
+        """Append-only on-disk dataset of a job.
+
+        The dataset is a directory holding meta.json (sweep axes, QUA program text, snapshot
+        of the QM configuration and any extra info) and one raw binary file per result,
+        to which chunks are appended as they arrive."""
+        self.path = path
+        os.makedirs(path, exist_ok=False)
+        self.meta = {"created": time.time(), "axes": {k: np.asarray(v).tolist() for k, v in (axes or {}).items()},
+                     "program": program, "config": config, "results": {}}
+        self.meta.update(info)
+        self.write_meta()
+
+    def write_meta(self):
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f, default=str)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def discard(self):
+        """Remove the dataset."""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def append(self, name, chunk):
+        """Append values to a result, the first dimension of chunk runs over the values."""
+        chunk = np.ascontiguousarray(chunk)
+        if name not in self.meta["results"]:
+            self.meta["results"][name] = {"dtype": chunk.dtype.str, "shape": list(chunk.shape[1:])}
+            self.write_meta()
+        with open(os.path.join(self.path, f"{name}.bin"), "ab") as f:
+            f.write(chunk.tobytes())
+
+    def save(self, name, array):
+        """Store a complete result at once."""
+        array = np.asarray(array)
+        self.append(name, array.reshape((1,) + array.shape))
+        self.meta["results"][name]["single"] = True
+        self.write_meta()
+
+
+class Archive:
+    def __init__(self, path):
+        """Lazy reader of a dataset written by ArchiveWriter, results are memory-mapped on access."""
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.axes = {k: np.asarray(v) for k, v in self.meta["axes"].items()}
+        self.program = self.meta["program"]
+        self.config = self.meta["config"]
+
+    def keys(self):
+        return self.meta["results"].keys()
+
+    def __getitem__(self, name):
+        info = self.meta["results"][name]
+        dtype = np.dtype(info["dtype"])
+        shape = tuple(info["shape"])
+        filename = os.path.join(self.path, f"{name}.bin")
+        count = os.path.getsize(filename) // (dtype.itemsize * int(np.prod(shape)))
+        if count == 0:
+            return np.empty((0,) + shape, dtype=dtype)
+        data = np.memmap(filename, dtype=dtype, mode="r", shape=(count,) + shape)
+        return data[0] if info.get("single") else data
@@ -0,0 +1,45 @@
+import asyncio
+import threading
+import zmq
+from QM_jobtable import recv_all
+
+
+class JobManager:
+    def __init__(self, context, endpoint, period=0.2, pending_period=1.):
+        """Monitor all the jobs of a kernel on a single asyncio event loop.
+
+        The loop runs in one background thread. Each job is a coroutine, blocking QM calls
+        are sent to the loop executor with call(). A single subscriber receives the JOBTABLE
+        messages on endpoint and hands them to every watched job.
+        Running jobs are polled every period seconds, pending jobs every pending_period seconds."""
+        self.context = context
+        self.endpoint = endpoint
+        self.period = period
+        self.pending_period = pending_period
+        self.jobs = set()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.listen(), self.loop)
+
+    def call(self, func, *args):
+        """Run a blocking function in the executor, return an awaitable of its result."""
+        return self.loop.run_in_executor(None, func, *args)
+
+    def watch(self, job):
+        """Run job.lifecycle(manager) on the event loop, return a concurrent future of its result."""
+        return asyncio.run_coroutine_threadsafe(job.lifecycle(self), self.loop)
+
+    async def listen(self):
+        socket_info = self.context.socket(zmq.SUB)
+        socket_info.connect(self.endpoint)
+        socket_info.subscribe("JOBTABLE")
+        try:
+            while True:
+                await asyncio.sleep(self.period)
+                msgs = [msg for topic, msg in recv_all(socket_info)]
+                if msgs:
+                    for job in list(self.jobs):
+                        job.display(msgs)
+        finally:
+            socket_info.close()
@@ -0,0 +1,110 @@
+from QM_estimate import FEATURES
+
+
+def readout_block(resonator="resonator", qubit="qubit", threshold=2e-4, reset_if=50000000, reset_duration=108):
+    """Readout with active reset shared by the notebooks, as a function readout(Sz, after_reset).
+
+    The resonator is measured, Sz is set to -0.5 or 0.5, and if the qubit is excited a pi pulse at
+    reset_if brings it back to the ground state. after_reset() is called inside the reset branch,
+    e.g. to restore a swept qubit frequency."""
+    def readout(Sz, after_reset=None):
+        from qm.qua import declare, fixed, measure, dual_demod, assign, Util, if_, update_frequency, play
+        I = declare(fixed)
+        Q = declare(fixed)
+        measure("readout", resonator, dual_demod.full("cos", "sin", I), dual_demod.full("minus_sin", "cos", Q))
+        assign(Sz, Util.cond(Q > threshold, -0.5, 0.5))
+        with if_(Q > threshold):
+            update_frequency(qubit, reset_if)
+            play("pi", qubit, duration=reset_duration)
+            if after_reset:
+                after_reset()
+    return readout
+
+
+class Experiment:
+    def __init__(self, name, sweep, prepare, after_reset=None, steps=()):
+        """Experiment of a batch.
+
+        prepare(v) plays the pulses of one pass before the shared readout, v being the QUA variables
+        of the axes of sweep. after_reset(v) is called in the reset branch of the readout. steps
+        describe the body for QM_estimate, readout included."""
+        self.name = name
+        self.sweep = sweep
+        self.prepare = prepare
+        self.after_reset = after_reset
+        self.steps = list(steps)
+
+
+class Batch:
+    def __init__(self, *experiments, readout=None, interleaved=False, resonator_if=59980000, qubit="qubit",
+                 qubit_if=50000000):
+        """Several experiments run by a single QUA program, one queue slot for a whole characterization.
+
+        Sequentially, each experiment runs all its averages in turn. Interleaved, every averaging
+        pass runs one sweep of each experiment, so that slow drifts affect them alike; they must
+        then have the same n_avg. Each experiment saves its averaged Sz under its own name.
+        Before each section the qubit is brought back to qubit_if with a fresh frame, whatever
+        frequency or phase the previous experiment swept."""
+        self.experiments = list(experiments)
+        self.readout = readout or readout_block()
+        self.interleaved = interleaved
+        self.resonator_if = resonator_if
+        self.qubit = qubit
+        self.qubit_if = qubit_if
+        if len({e.name for e in self.experiments}) != len(self.experiments):
+            raise ValueError("Experiment names must be unique")
+        if interleaved and len({e.sweep.n_avg for e in self.experiments}) > 1:
+            raise ValueError("Interleaved experiments must have the same n_avg")
+
+    def reset(self):
+        from qm.qua import update_frequency, reset_frame
+        update_frequency(self.qubit, self.qubit_if)
+        reset_frame(self.qubit)
+
+    def body(self, experiment, v, Sz, stream):
+        from qm.qua import align, save
+        experiment.prepare(v)
+        align()
+        after_reset = (lambda: experiment.after_reset(v)) if experiment.after_reset else None
+        self.readout(Sz, after_reset)
+        save(Sz, stream)
+
+    def program(self):
+        """QUA program running all the experiments."""
+        from qm.qua import program, declare, declare_stream, fixed, for_, update_frequency, stream_processing
+        with program() as qmprog:
+            Sz = declare(fixed)
+            streams = [declare_stream() for e in self.experiments]
+            update_frequency("resonator", self.resonator_if)
+            if self.interleaved:
+                n = declare(int)
+                with for_(n, 0, n < self.experiments[0].sweep.n_avg, n + 1):
+                    for experiment, stream in zip(self.experiments, streams):
+                        self.reset()
+                        with experiment.sweep.loop(average=False) as v:
+                            self.body(experiment, v, Sz, stream)
+            else:
+                for experiment, stream in zip(self.experiments, streams):
+                    self.reset()
+                    with experiment.sweep.loop() as v:
+                        self.body(experiment, v, Sz, stream)
+            with stream_processing():
+                for experiment, stream in zip(self.experiments, streams):
+                    experiment.sweep.save(stream, experiment.name)
+        return qmprog
+
+    def estimate(self, estimator):
+        """Predicted run time in seconds with a QM_estimate.DurationEstimator, one load overhead for all."""
+        features = [estimator.features(e.sweep, e.steps) for e in self.experiments]
+        total = {k: sum(f[k] for f in features) for k in features[0]}
+        total["jobs"] = 1.
+        return float(estimator.coefficients @ [total[k] for k in FEATURES])
+
+    def split(self, job):
+        """Results of a QM.Job running the batch, {experiment name: SweepData with Sz}."""
+        results = job.get_results(*[e.name for e in self.experiments])
+        out = {}
+        for experiment, data in zip(self.experiments, results):
+            out[experiment.name] = experiment.sweep.allocate("Sz")
+            out[experiment.name].set("Sz", data)
+        return out
@@ -0,0 +1,89 @@
+import time
+
+
+class FairShareScheduler:
+    def __init__(self, half_life=600., aging=0.1, max_queued=3, clock=time.time):
+        """Order job submissions by per-user fair share and estimated duration.
+
+        The priority of a submission is the recent machine usage of its user (decaying with
+        half_life seconds) plus its estimated duration minus aging times the time it has been
+        waiting, the lowest goes first. Short jobs of light users pass first and nobody starves.
+        Each user may have at most max_queued submissions waiting."""
+        self.half_life = half_life
+        self.aging = aging
+        self.max_queued = max_queued
+        self.clock = clock
+        self.waiting = {}
+        self.granted = {}
+        self._usage = {}
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def usage(self, user):
+        """Decayed run time of the user, in seconds."""
+        value, t = self._usage.get(user, (0., 0.))
+        now = self.clock()
+        return value * 0.5 ** ((now - t) / self.half_life)
+
+    def charge(self, user, duration):
+        self._usage[user] = (max(0., self.usage(user) + duration), self.clock())
+
+    def submit(self, token, user, estimate):
+        """Queue a submission, return False if the user exceeds the quota.
+
+        Submitting a token again is accepted and keeps its place."""
+        if token in self.waiting or token in self.granted:
+            return True
+        if sum(1 for r in self.waiting.values() if r["user"] == user) >= self.max_queued:
+            return False
+        self.waiting[token] = {"token": token, "user": user, "estimate": estimate, "time": self.clock()}
+        return True
+
+    def withdraw(self, token):
+        self.waiting.pop(token, None)
+        self.granted.pop(token, None)
+
+    def priority(self, request):
+        return self.usage(request["user"]) + request["estimate"] - self.aging * (self.clock() - request["time"])
+
+    def release(self):
+        """Pop the submission that goes next, None if nothing is waiting.
+
+        The user is charged with the estimated duration until the job reports its actual run time."""
+        if not self.waiting:
+            return None
+        request = min(self.waiting.values(), key=self.priority)
+        del self.waiting[request["token"]]
+        request["released"] = self.clock()
+        self.granted[request["token"]] = request
+        self.charge(request["user"], request["estimate"])
+        return request
+
+    def expire(self, timeout):
+        """Forget the released jobs that never reported their end, return their tokens.
+
+        A job is forgotten timeout seconds after its release if it did not start, or timeout seconds
+        after its estimated end if it did. It stays charged with its estimate."""
+        now = self.clock()
+
+        def deadline(request):
+            if "start" in request:
+                return request["start"] + request["estimate"] + timeout
+            return request["released"] + timeout
+        expired = [token for token, request in self.granted.items() if now > deadline(request)]
+        for token in expired:
+            del self.granted[token]
+        return expired
+
+    def started(self, token):
+        request = self.granted.get(token)
+        if request:
+            request["start"] = self.clock()
+
+    def done(self, token):
+        """Replace the estimated duration of a released job by its actual run time."""
+        request = self.granted.pop(token, None)
+        if request:
+            duration = self.clock() - request["start"] if "start" in request else 0.
+            self.charge(request["user"], duration - request["estimate"])
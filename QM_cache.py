@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+import time
+import numpy as np
+
+# Parts of the QM configuration that change what a program measures
+CONFIG_KEYS = ("controllers", "elements", "pulses", "waveforms", "digital_waveforms",
+               "integration_weights", "mixers", "octaves")
+
+
+class ResultCache:
+    def __init__(self, path="result_cache", max_bytes=2**30, max_age=7*24*3600.):
+        """Results of past jobs, addressed by a hash of the QUA program and of the QM configuration.
+
+        Entries are npz files. Entries older than max_age seconds are dropped, then the
+        least recently used ones until the cache is below max_bytes."""
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, program, config):
+        """Hash of the QUA script and of the relevant part of the configuration, None if the program is unknown."""
+        if not program:
+            return None
+        subset = {k: config[k] for k in CONFIG_KEYS if k in config}
+        # The script header holds its generation date
+        program = "\n".join(line for line in program.splitlines() if not line.startswith("# Single QUA script generated at"))
+        h = hashlib.sha256(program.encode())
+        h.update(json.dumps(subset, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.path, f"{key}.npz")
+
+    def get(self, key, names):
+        """Stored results for names, None on a miss."""
+        if key is None:
+            return None
+        filename = self.filename(key)
+        try:
+            with np.load(filename) as data:
+                results = tuple(data[name] for name in names)
+        except (OSError, KeyError):
+            return None
+        if time.time() - os.path.getmtime(filename) > self.max_age:
+            return None
+        os.utime(filename)
+        return results
+
+    def put(self, key, names, results):
+        if key is None:
+            return
+        filename = self.filename(key)
+        try:
+            with np.load(filename) as data:
+                arrays = dict(data)
+        except OSError:
+            arrays = {}
+        arrays.update(zip(names, results))
+        tmp = filename + ".tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, filename)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.path):
+            filename = os.path.join(self.path, name)
+            if name.endswith(".npz") and not name.endswith(".tmp.npz"):
+                st = os.stat(filename)
+                entries.append((st.st_mtime, st.st_size, filename))
+        entries.sort()
+        total = sum(size for mtime, size, filename in entries)
+        now = time.time()
+        for mtime, size, filename in entries:
+            if total <= self.max_bytes and now - mtime <= self.max_age:
+                break
+            os.remove(filename)
+            total -= size
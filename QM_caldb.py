@@ -0,0 +1,73 @@
+import json
+import os
+
+TABLES = ("modes", "lo_modes", "lo_cal", "if_modes", "if_cal")
+
+
+class CalibrationDB:
+    def __init__(self, path="calibration_db.json"):
+        """Octave calibration database with in-memory indexes.
+
+        The file written by the QM keys the tables modes, lo_modes, lo_cal, if_modes and if_cal
+        by incrementing ids, lo_modes and if_modes pointing to their latest calibration.
+        The latest calibrations are indexed by (octave, channel, LO, gain) and IF."""
+        self.path = path
+        self.tables = {name: {} for name in TABLES}
+        if os.path.isfile(path):
+            with open(path) as f:
+                self.tables.update(json.load(f))
+        self.index()
+
+    def index(self):
+        self.lo_index = {}
+        for lo_mode_id, lo_mode in self.tables["lo_modes"].items():
+            mode = self.tables["modes"][str(lo_mode["mode_id"])]
+            key = (mode["octave_name"], mode["octave_channel"], round(lo_mode["lo_freq"]), float(lo_mode["gain"]))
+            self.lo_index[key] = lo_mode_id
+        self.if_index = {lo_mode_id: {} for lo_mode_id in self.tables["lo_modes"]}
+        for if_mode_id, if_mode in self.tables["if_modes"].items():
+            self.if_index.setdefault(str(if_mode["lo_mode_id"]), {})[round(if_mode["if_freq"])] = if_mode_id
+
+    def lo_calibration(self, octave, channel, lo, gain):
+        """Latest LO calibration, None if there is none."""
+        lo_mode_id = self.lo_index.get((octave, channel, round(lo), float(gain)))
+        if lo_mode_id is None:
+            return None
+        return self.tables["lo_cal"].get(str(self.tables["lo_modes"][lo_mode_id]["latest"]))
+
+    def if_calibration(self, octave, channel, lo, gain, if_freq):
+        """Latest IF calibration, None if there is none."""
+        lo_mode_id = self.lo_index.get((octave, channel, round(lo), float(gain)))
+        if_mode_id = self.if_index.get(lo_mode_id, {}).get(round(if_freq))
+        if if_mode_id is None:
+            return None
+        return self.tables["if_cal"].get(str(self.tables["if_modes"][if_mode_id]["latest"]))
+
+    def latest(self):
+        """Latest LO and IF calibrations, {(octave, channel, LO, gain): (lo_cal, {IF: if_cal})}"""
+        out = {}
+        for key, lo_mode_id in self.lo_index.items():
+            ifs = {if_freq: self.tables["if_cal"][str(self.tables["if_modes"][if_mode_id]["latest"])]
+                   for if_freq, if_mode_id in self.if_index[lo_mode_id].items()}
+            out[key] = (self.tables["lo_cal"][str(self.tables["lo_modes"][lo_mode_id]["latest"])], ifs)
+        return out
+
+    def compact(self):
+        """Remove the calibrations superseded by a later one, return the number of entries removed.
+
+        Ids are kept, the latest pointers stay valid."""
+        removed = 0
+        for modes, cals in (("lo_modes", "lo_cal"), ("if_modes", "if_cal")):
+            keep = {str(mode["latest"]) for mode in self.tables[modes].values()}
+            table = self.tables[cals]
+            self.tables[cals] = {k: v for k, v in table.items() if k in keep}
+            removed += len(table) - len(self.tables[cals])
+        return removed
+
+    def save(self, path=None):
+        """Write the database atomically, the file is only replaced once fully written."""
+        path = path or self.path
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.tables, f, indent=4)
+        os.replace(tmp, path)
@@ -0,0 +1,45 @@
+import time
+from QM_caldb import CalibrationDB
+
+
+def element_mode(config, element):
+    """(octave name, octave channel, LO gain) driving an element of the configuration."""
+    octave, channel = config["elements"][element]["RF_inputs"]["port"]
+    gain = config["octaves"][octave]["RF_outputs"][channel]["gain"]
+    return octave, channel, gain
+
+
+def calibration_plan(config, calibration_tasks, db_path="calibration_db.json", max_age=7*24*3600., max_drift=2.,
+                     temperature=None):
+    """Select the (LO, IF) pairs of calibration_tasks that need a new calibration.
+
+    A pair is calibrated again if it is missing from the database, older than max_age seconds,
+    or if its temperature differs by more than max_drift degrees from the current temperature
+    of the octave. Without a temperature, the last temperature recorded for the octave is used.
+    Returns the tasks to run, grouped by element as in calibration_tasks, and the list of
+    skipped (element, LO, IF, age in seconds)."""
+    calibrations = CalibrationDB(db_path).latest()
+    latest_temperature = {}
+    for (octave, channel, lo, gain), (lo_cal, ifs) in calibrations.items():
+        for cal in [lo_cal, *ifs.values()]:
+            if cal["timestamp"] > latest_temperature.get(octave, (0, None))[0]:
+                latest_temperature[octave] = (cal["timestamp"], cal["temperature"])
+    now = time.time()
+
+    def fresh(cal, octave):
+        reference = temperature if temperature is not None else latest_temperature[octave][1]
+        return now - cal["timestamp"] < max_age and abs(cal["temperature"] - reference) <= max_drift
+
+    tasks, skipped = {}, []
+    for element, lo_list in calibration_tasks.items():
+        octave, channel, gain = element_mode(config, element)
+        for lo, if_list in lo_list.items():
+            lo_cal, ifs = calibrations.get((octave, channel, round(lo), float(gain)), (None, {}))
+            lo_ok = lo_cal is not None and fresh(lo_cal, octave)
+            for if_freq in if_list:
+                if_cal = ifs.get(round(if_freq))
+                if lo_ok and if_cal is not None and fresh(if_cal, octave):
+                    skipped.append((element, lo, if_freq, now - min(lo_cal["timestamp"], if_cal["timestamp"])))
+                else:
+                    tasks.setdefault(element, {}).setdefault(lo, []).append(if_freq)
+    return tasks, skipped
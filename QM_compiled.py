@@ -0,0 +1,24 @@
+class ProgramCache:
+    def __init__(self, factory):
+        """Compiled programs of a program factory, keyed by the factory arguments and the QM id.
+
+        The factory returns a QUA program, or a tuple whose first item is the program.
+        Entries compiled on another QM are dropped as soon as the QM is reopened."""
+        self.factory = factory
+        self.programs = {}
+
+    def add(self, qm, *args, **kwargs):
+        """Queue the program built by factory(*args, **kwargs), compiling it only on first use.
+
+        Returns the pending job and the output of the factory."""
+        key = (qm.id, args, tuple(sorted(kwargs.items())))
+        if key not in self.programs:
+            self.programs = {k: v for k, v in self.programs.items() if k[0] == qm.id}
+            out = self.factory(*args, **kwargs)
+            qmprog = out[0] if isinstance(out, tuple) else out
+            self.programs[key] = (qm.compile(qmprog), out)
+        program_id, out = self.programs[key]
+        return qm.queue.add_compiled(program_id), out
+
+    def clear(self):
+        self.programs = {}
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import math
+
+
+def normalize(value):
+    """Canonical form of a configuration: string keys, lists instead of tuples and arrays, floats for numbers."""
+    if isinstance(value, dict):
+        return {str(k): normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize(v) for v in value]
+    if hasattr(value, "tolist"):
+        return normalize(value.tolist())
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    return str(value)
+
+
+def config_hash(config):
+    """Hash of the canonical form of a configuration."""
+    return hashlib.sha256(json.dumps(normalize(config), sort_keys=True).encode()).hexdigest()
+
+
+# Collections whose entries are named by the user, an entry removed locally is a difference
+NAMED = ("elements", "operations", "pulses", "waveforms")
+
+
+def project(live, local, key=None):
+    """Restrict the live configuration returned by the QM to the keys present in the local one.
+
+    The QM adds default values to the configuration it was opened with, they are ignored.
+    The entries of the NAMED collections are all kept, except the internal ones starting with __."""
+    if isinstance(local, dict) and isinstance(live, dict):
+        out = {k: project(live[k], v, k) for k, v in local.items() if k in live}
+        if key in NAMED:
+            out.update({k: v for k, v in live.items() if k not in local and not k.startswith("__")})
+        return out
+    return live
+
+
+def config_diff(local, live, path=""):
+    """List of (path, local value, live value) where the two normalized configurations differ.
+
+    Missing keys have the value None, the live configuration should be projected first."""
+    if isinstance(local, dict) and isinstance(live, dict):
+        diff = []
+        for k, v in local.items():
+            if k not in live:
+                diff.append((f"{path}/{k}", v, None))
+            else:
+                diff += config_diff(v, live[k], f"{path}/{k}")
+        for k, v in live.items():
+            if k not in local:
+                diff.append((f"{path}/{k}", None, v))
+        return diff
+    if isinstance(local, list) and isinstance(live, list) and len(local) == len(live):
+        diff = []
+        for i, (a, b) in enumerate(zip(local, live)):
+            diff += config_diff(a, b, f"{path}[{i}]")
+        # Long waveforms are reported once
+        return [(path, local, live)] if len(diff) > 3 else diff
+    if isinstance(local, float) and isinstance(live, float):
+        return [] if math.isclose(local, live, rel_tol=1e-6, abs_tol=1e-12) else [(path, local, live)]
+    return [] if local == live else [(path, local, live)]
+
+
+def compare(local, live):
+    """Differences between a local configuration and the configuration of a running QM, empty if they match."""
+    local = normalize(local)
+    live = project(normalize(live), local)
+    if config_hash(local) == config_hash(live):
+        return []
+    return config_diff(local, live)
+
+
+def format_diff(diff, width=60):
+    lines = []
+    for path, local, live in diff:
+        local, live = repr(local), repr(live)
+        if len(local) > width:
+            local = local[:width] + "..."
+        if len(live) > width:
+            live = live[:width] + "..."
+        lines.append(f"  {path}: {live} -> {local}\n")
+    return "".join(lines)
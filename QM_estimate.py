@@ -0,0 +1,103 @@
+import json
+import os
+import numpy as np
+
+# Steps of the body of a sweep, durations are in clock cycles (4 ns) and may name an axis of the sweep
+
+
+def play(element, operation, duration=None):
+    return ("play", element, operation, duration, 1.)
+
+
+def measure(element, operation):
+    return ("measure", element, operation, None, 1.)
+
+
+def wait(duration):
+    return ("wait", None, None, duration, 1.)
+
+
+def reset(element, operation, duration=None, probability=0.5):
+    """Active reset branch, played with the given probability."""
+    return ("play", element, operation, duration, probability)
+
+
+FEATURES = ("jobs", "time", "passes", "instructions")
+# Starting values of the corrections: load overhead (s), scale of the pulse time, overhead per pass
+# through the body (s) and per instruction (s), and their typical deviations. A deviation of one
+# SCALE weighs as much as a 1% error on one observed run time.
+PRIOR = np.array([1., 1., 0., 0.])
+SCALE = np.array([1., 0.1, 1e-6, 1e-7])
+
+
+class DurationEstimator:
+    def __init__(self, config, path="duration_model.json"):
+        """Run time of a sweep from the pulse lengths of the configuration, corrected by past runs.
+
+        The prediction is a linear function of the number of jobs (load overhead), of the time spent
+        in pulses, measurements and waits, of the number of passes through the body and of the number
+        of instructions. Its coefficients start from PRIOR and are fitted to the run times given to
+        observe(), which are kept in path. The run times must include compilation and loading,
+        e.g. QM.Job.total_time, for the load overhead to be fitted."""
+        self.config = config
+        self.path = path
+        self.observations = []
+        if path and os.path.isfile(path):
+            with open(path) as f:
+                self.observations = json.load(f)
+        self.fit()
+
+    def pulse_length(self, element, operation):
+        """Length in ns of the pulse of an operation of an element."""
+        pulse = self.config["elements"][element]["operations"][operation]
+        return self.config["pulses"][pulse]["length"]
+
+    def step_time(self, step, values):
+        """Time in ns of a step, an array over the grid if its duration names an axis."""
+        kind, element, operation, duration, probability = step
+        if isinstance(duration, str):
+            duration = values[duration]
+        if duration is not None:
+            time = 4 * duration
+        else:
+            time = self.pulse_length(element, operation)
+        if kind == "measure":
+            time = time + self.config["elements"][element].get("time_of_flight", 0) + \
+                self.config["elements"][element].get("smearing", 0)
+        return probability * time
+
+    def features(self, sweep, steps):
+        """Features of a sweep run with the given body steps."""
+        values = sweep.grid()
+        time = sum(np.broadcast_to(self.step_time(step, values), sweep.shape).sum() for step in steps) * 1e-9
+        passes = sweep.size * sweep.n_avg
+        return {"jobs": 1., "time": float(time * sweep.n_avg), "passes": float(passes),
+                "instructions": float(passes * len(steps))}
+
+    def estimate(self, sweep, steps):
+        """Predicted run time in seconds."""
+        features = self.features(sweep, steps)
+        return float(self.coefficients @ [features[k] for k in FEATURES])
+
+    def observe(self, sweep, steps, run_time):
+        """Add the measured run time of a sweep and refit the corrections."""
+        if run_time is None:
+            return
+        self.observations.append(dict(self.features(sweep, steps), run_time=run_time))
+        if self.path:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.observations, f)
+            os.replace(tmp, self.path)
+        self.fit()
+
+    def fit(self):
+        """Least squares on the relative errors, regularized towards PRIOR."""
+        D = np.diag(1e-4 / SCALE ** 2)
+        if not self.observations:
+            self.coefficients = PRIOR.copy()
+            return
+        X = np.array([[obs[k] for k in FEATURES] for obs in self.observations])
+        y = np.array([obs["run_time"] for obs in self.observations])
+        W = 1 / np.maximum(y, 1e-3) ** 2
+        self.coefficients = np.linalg.solve(X.T @ (W[:, None] * X) + D, X.T @ (W * y) + D @ PRIOR)
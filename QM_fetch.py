@@ -0,0 +1,52 @@
+import numpy as np
+
+
+class StreamFetcher:
+    def __init__(self, handle, size=1024, path=None, on_chunk=None):
+        """Copy the values of a save_all stream into a preallocated buffer while the job runs.
+
+        Each poll() only fetches the values saved since the previous one. The buffer holds
+        size values to start with and doubles when full. If path is given the buffer is a
+        memory-mapped file, so that long acquisitions do not stay in memory.
+        on_chunk is called with every chunk of new values."""
+        self.handle = handle
+        self.on_chunk = on_chunk
+        self.size = size
+        self.path = path
+        self.count = 0
+        self.buffer = None
+
+    def allocate(self, size, item):
+        if self.path is None:
+            buffer = np.empty((size,) + item.shape[1:], dtype=item.dtype)
+            if self.buffer is not None:
+                buffer[:self.count] = self.buffer[:self.count]
+            self.buffer = buffer
+            return
+        if self.buffer is not None:
+            self.buffer.flush()
+        with open(self.path, "ab") as f:
+            f.truncate(size * item[0].nbytes)
+        self.buffer = np.memmap(self.path, dtype=item.dtype, mode="r+", shape=(size,) + item.shape[1:])
+
+    def poll(self):
+        """Fetch the new values, return the number of values received so far."""
+        count = self.handle.count_so_far()
+        if count > self.count:
+            chunk = np.asarray(self.handle.fetch(slice(self.count, count), flat_struct=True))
+            if self.buffer is None or count > len(self.buffer):
+                size = max(self.size, len(self.buffer) if self.buffer is not None else 0)
+                while size < count:
+                    size *= 2
+                self.allocate(size, chunk)
+            self.buffer[self.count:count] = chunk
+            self.count = count
+            if self.on_chunk:
+                self.on_chunk(chunk)
+        return self.count
+
+    def result(self):
+        """Values received so far, call poll() first to get the latest ones."""
+        if self.buffer is None:
+            return np.empty(0)
+        return self.buffer[:self.count]
@@ -0,0 +1,174 @@
+import numpy as np
+
+
+def exp_decay(t, a, tau, ofs=0.):
+    return a * np.exp(-t / tau) + ofs
+
+
+def cosine_phase(phi, a, ofs, phi0):
+    """Signal of a phase sweep, phi in turns."""
+    return -a * np.cos(2 * np.pi * phi + phi0) + ofs
+
+
+def damped_cosine(t, a, tau, f, phi, ofs):
+    return a * np.exp(-t / tau) * np.cos(2 * np.pi * f * t + phi) + ofs
+
+
+def _rows(y):
+    y = np.asarray(y, dtype=float)
+    return y.reshape(1, -1) if y.ndim == 1 else y, y.ndim == 1
+
+
+def _unrows(single, *arrays):
+    return tuple(a[0] for a in arrays) if single else arrays
+
+
+def _linear(X, y):
+    """Least squares solution of X[i] @ p[i] = y[i] for every row i, X is (rows, n, k) or (n, k)."""
+    if X.ndim == 2:
+        return np.linalg.lstsq(X, y.T, rcond=None)[0].T
+    XtX = X.transpose(0, 2, 1) @ X
+    Xty = (X.transpose(0, 2, 1) @ y[..., None])[..., 0]
+    return (np.linalg.pinv(XtX) @ Xty[..., None])[..., 0]
+
+
+def _lm(model, jacobian, x, y, p, iterations=50, rtol=1e-8):
+    """Levenberg-Marquardt run on all the rows of y at once. Returns parameters and their standard errors.
+
+    jacobian returns the derivatives of the model with shape (rows, parameters, points). A row stops being iterated once a step improves its cost by less than rtol."""
+    p = p.copy()
+    r = y - model(x, p)
+    cost = np.sum(r ** 2, axis=1)
+    lam = np.full(len(y), 1e-3)
+    active = np.isfinite(cost)
+    k = p.shape[1]
+    for i in range(iterations):
+        rows = np.flatnonzero(active)
+        if not len(rows):
+            break
+        Jt = jacobian(x, p[rows])
+        JtJ = Jt @ Jt.transpose(0, 2, 1)
+        g = (Jt @ r[rows, :, None])[..., 0]
+        d = np.diagonal(JtJ, axis1=1, axis2=2)
+        A = JtJ + (lam[rows, None] * d + 1e-15 * d.max(axis=1, keepdims=True) + 1e-300)[..., None] * np.eye(k)
+        with np.errstate(all="ignore"):
+            p_new = p[rows] + np.linalg.solve(A, g[..., None])[..., 0]
+            r_new = y[rows] - model(x, p_new)
+            cost_new = np.sum(r_new ** 2, axis=1)
+        better = np.isfinite(cost_new) & (cost_new < cost[rows])
+        done = (better & (cost[rows] - cost_new <= rtol * cost[rows])) | (lam[rows] > 1e10)
+        improved = rows[better]
+        p[improved], r[improved], cost[improved] = p_new[better], r_new[better], cost_new[better]
+        lam[rows] = np.where(better, lam[rows] / 3, lam[rows] * 4)
+        active[rows[done]] = False
+    Jt = jacobian(x, p)
+    s2 = cost / max(y.shape[1] - k, 1)
+    cov = s2[:, None, None] * np.linalg.pinv(Jt @ Jt.transpose(0, 2, 1))
+    return p, np.sqrt(np.abs(np.diagonal(cov, axis1=1, axis2=2)))
+
+
+def fit_phase(phi, y):
+    """Fit cosine_phase to every row of y, phi in turns.
+
+    The model is linear in (a cos phi0, a sin phi0, ofs), all rows are solved by a single least
+    squares. Returns (popt, perr) with parameters (a, ofs, phi0) along the last axis."""
+    y, single = _rows(y)
+    phi = np.asarray(phi, dtype=float)
+    X = np.stack([np.cos(2 * np.pi * phi), np.sin(2 * np.pi * phi), np.ones_like(phi)], axis=1)
+    coef = _linear(X, y)
+    A, B, ofs = coef.T
+    a = np.hypot(A, B)
+    popt = np.stack([a, ofs, np.arctan2(B, -A)], axis=1)
+    s2 = np.sum((y - coef @ X.T) ** 2, axis=1) / max(len(phi) - 3, 1)
+    cov = np.linalg.pinv(X.T @ X)
+    with np.errstate(all="ignore"):
+        var_a = (A ** 2 * cov[0, 0] + B ** 2 * cov[1, 1] + 2 * A * B * cov[0, 1]) / a ** 2
+        var_phi0 = (B ** 2 * cov[0, 0] + A ** 2 * cov[1, 1] - 2 * A * B * cov[0, 1]) / a ** 4
+    perr = np.sqrt(s2[:, None] * np.stack([var_a, np.full_like(a, cov[2, 2]), var_phi0], axis=1))
+    return _unrows(single, popt, perr)
+
+
+def fit_exp(t, y, offset=True, iterations=50):
+    """Fit exp_decay to every row of y.
+
+    Starting values come from a linear regression of y on its running integral, then all rows
+    are refined together. Returns (popt, perr) with parameters (a, tau[, ofs]) along the last axis."""
+    y, single = _rows(y)
+    t = np.asarray(t, dtype=float)
+    S = np.concatenate([np.zeros((len(y), 1)), np.cumsum((y[:, 1:] + y[:, :-1]) / 2 * np.diff(t), axis=1)], axis=1)
+    cols = [np.ones_like(y), S] + ([np.broadcast_to(t - t[0], y.shape)] if offset else [])
+    c = _linear(np.stack(cols, axis=2), y)
+    with np.errstate(divide="ignore"):
+        tau = np.where(c[:, 1] < 0, -1 / c[:, 1], t[-1] - t[0])
+    e = np.exp(-t / tau[:, None])
+    cols = [e, np.ones_like(e)] if offset else [e]
+    c = _linear(np.stack(cols, axis=2), y)
+    p0 = np.stack([c[:, 0], tau] + ([c[:, 1]] if offset else []), axis=1)
+
+    def model(t, p):
+        return exp_decay(t, p[:, :1], p[:, 1:2], p[:, 2:3] if offset else 0.)
+
+    def jacobian(t, p):
+        e = np.exp(-t / p[:, 1:2])
+        cols = [e, p[:, :1] * t * e / p[:, 1:2] ** 2] + ([np.ones_like(e)] if offset else [])
+        return np.stack(cols, axis=1)
+
+    return _unrows(single, *_lm(model, jacobian, t, y, p0, iterations))
+
+
+def fit_damped_cosine(t, y, iterations=50):
+    """Fit damped_cosine to every row of y, t evenly spaced.
+
+    The frequency of each row is seeded by the peak of its FFT, amplitude and phase by a linear
+    fit. Returns (popt, perr) with parameters (a, tau, f, phi, ofs) along the last axis."""
+    y, single = _rows(y)
+    t = np.asarray(t, dtype=float)
+    ofs = y.mean(axis=1)
+    # Zero padding refines the frequency grid
+    spectrum = np.abs(np.fft.rfft(y - ofs[:, None], 4 * len(t), axis=1))
+    freqs = np.fft.rfftfreq(4 * len(t), t[1] - t[0])
+    f = freqs[1 + np.argmax(spectrum[:, 1:], axis=1)]
+    tau = np.full(len(y), t[-1] - t[0])
+    w = 2 * np.pi * f[:, None] * t
+    c = _linear(np.stack([np.cos(w), np.sin(w), np.ones_like(w)], axis=2), y)
+    p0 = np.stack([np.hypot(c[:, 0], c[:, 1]), tau, f, np.arctan2(-c[:, 1], c[:, 0]), c[:, 2]], axis=1)
+
+    def model(t, p):
+        return damped_cosine(t, *(p[:, i:i + 1] for i in range(5)))
+
+    def jacobian(t, p):
+        a, tau, f, phi, ofs = (p[:, i:i + 1] for i in range(5))
+        # One complex exponential gives exp(-t/tau) cos and exp(-t/tau) sin
+        z = np.exp((2j * np.pi * f - 1 / tau) * t + 1j * phi)
+        ecos, esin = z.real, z.imag
+        return np.stack([ecos, a * t * ecos / tau ** 2, -2 * np.pi * a * t * esin, -a * esin,
+                         np.ones_like(ecos)], axis=1)
+
+    popt, perr = _lm(model, jacobian, t, y, p0, iterations)
+    # Same oscillation with a positive amplitude
+    flip = popt[:, 0] < 0
+    popt[flip, 0] *= -1
+    popt[flip, 3] += np.pi
+    popt[:, 3] = np.angle(np.exp(1j * popt[:, 3]))
+    return _unrows(single, popt, perr)
+
+
+def fit_chevron(t, detuning, y, iterations=50):
+    """Fit a Rabi chevron, one row of y per detuning.
+
+    Each row is fitted by fit_damped_cosine, then the generalized Rabi frequencies by
+    f^2 = f_rabi^2 + (detuning - center)^2, detuning in the units of 1/t. Rows whose
+    oscillation is not resolved (amplitude below 3 standard errors) are left out.
+    Returns (f_rabi, center, popt, perr)."""
+    detuning = np.asarray(detuning, dtype=float)
+    popt, perr = fit_damped_cosine(t, y, iterations)
+    f = popt[:, 2]
+    ok = np.isfinite(f) & (popt[:, 0] > 3 * perr[:, 0])
+    # f^2 - detuning^2 = f_rabi^2 + center^2 - 2 center detuning, rows locked on noise are rejected
+    X = np.stack([np.ones_like(detuning), detuning], axis=1)
+    for i in range(3):
+        c0, c1 = np.linalg.lstsq(X[ok], f[ok] ** 2 - detuning[ok] ** 2, rcond=None)[0]
+        residual = np.abs(np.sqrt(np.maximum(c0 + c1 * detuning + detuning ** 2, 0.)) - f)
+        ok &= residual <= 5 * np.median(residual[ok]) + 1e-12
+    center = -c1 / 2
+    return np.sqrt(max(c0 - center ** 2, 0.)), center, popt, perr
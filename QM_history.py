@@ -0,0 +1,97 @@
+import queue
+import sqlite3
+import threading
+import time
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS events (
+    id TEXT, qm_id TEXT, user TEXT, status TEXT, time REAL
+);
+CREATE INDEX IF NOT EXISTS events_job ON events (id, qm_id, status);
+CREATE INDEX IF NOT EXISTS events_time ON events (time);
+"""
+
+# One row per job with the time of each stage, an outcome row may be missing for jobs in flight.
+# Jobs that ran straight away have no pending event, their wait starts when they run.
+JOBS = """SELECT id, qm_id, MAX(user) AS user,
+    COALESCE(MIN(CASE WHEN status='pending' THEN time END), MIN(CASE WHEN status='running' THEN time END)) AS pending,
+    MIN(CASE WHEN status='running' THEN time END) AS running,
+    MIN(CASE WHEN status IN ('finished','halted','canceled') THEN time END) AS done
+FROM events
+GROUP BY id, qm_id
+HAVING MIN(time)>=?"""
+
+
+class JobHistory(threading.Thread):
+    def __init__(self, path="job_history.sqlite", batch_period=2.):
+        """Persistent store of the JOB events sent by QM.Job and QM.JobSimple.
+
+        record() only puts the event in a queue, a background thread writes
+        the queued events to the SQLite file in one transaction every batch_period seconds."""
+        super().__init__(daemon=True)
+        self.path = path
+        self.batch_period = batch_period
+        self.events = queue.Queue()
+        self.keeprunning = True
+        db = self.connect()
+        db.executescript(SCHEMA)
+        db.close()
+        self.start()
+
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=10.)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def record(self, event):
+        """Queue a JOB event for writing."""
+        self.events.put(event)
+
+    def run(self):
+        db = self.connect()
+        while self.keeprunning or not self.events.empty():
+            time.sleep(self.batch_period if self.keeprunning else 0)
+            self.flush(db)
+        db.close()
+
+    def flush(self, db):
+        batch = []
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            batch.append((event["id"], event["qm_id"], event["user"], event["status"], event["time"]))
+        if batch:
+            with db:
+                db.executemany("INSERT INTO events VALUES (?,?,?,?,?)", batch)
+
+    def close(self):
+        """Write the pending events and stop the writer thread."""
+        self.keeprunning = False
+        self.join()
+
+    def query(self, sql, args=()):
+        db = self.connect()
+        try:
+            return db.execute(sql, args).fetchall()
+        finally:
+            db.close()
+
+    def wait_times(self, since=0.):
+        """Queue wait time per user: {user: (number of jobs, mean wait, max wait)} in seconds."""
+        rows = self.query(f"""SELECT user, COUNT(*), AVG(running-pending), MAX(running-pending)
+            FROM ({JOBS}) WHERE running IS NOT NULL GROUP BY user""", (since,))
+        return {user: (n, mean, longest) for user, n, mean, longest in rows}
+
+    def run_times(self, since=0.):
+        """Run time per user: {user: (number of jobs, mean run time, max run time)} in seconds."""
+        rows = self.query(f"""SELECT user, COUNT(*), AVG(done-running), MAX(done-running)
+            FROM ({JOBS}) WHERE running IS NOT NULL AND done IS NOT NULL GROUP BY user""", (since,))
+        return {user: (n, mean, longest) for user, n, mean, longest in rows}
+
+    def machine_share(self, since=0.):
+        """Fraction of the total run time used by each user: {user: share}."""
+        rows = self.query(f"""SELECT user, SUM(done-running)
+            FROM ({JOBS}) WHERE running IS NOT NULL AND done IS NOT NULL GROUP BY user""", (since,))
+        total = sum(t for user, t in rows)
+        return {user: t / total for user, t in rows} if total else {}
@@ -0,0 +1,99 @@
+import time
+import uuid
+import zmq
+
+
+def recv_all(socket):
+    """Receive every pending (topic, message) pair of a socket without blocking."""
+    msgs = []
+    while True:
+        try:
+            topic = socket.recv_string(flags=zmq.NOBLOCK)
+        except zmq.Again:
+            return msgs
+        msgs.append((topic, socket.recv_json()))
+
+
+def diff_tables(old, new):
+    """Return the entries of the new table that differ from the old one, None if the tables are equal."""
+    old_jobs = {job["id"]: job for job in old}
+    changed = [job for job in new if old_jobs.get(job["id"]) != job]
+    if not changed and [job["id"] for job in old] == [job["id"] for job in new]:
+        return None
+    return changed
+
+
+class JobTablePublisher:
+    def __init__(self, socket, snapshot_period=5.):
+        """Publish the job table on a ZMQ socket as versioned deltas.
+
+        A message is only sent when the table changes, plus a full snapshot every
+        snapshot_period seconds so that late subscribers can resync."""
+        self.socket = socket
+        self.snapshot_period = snapshot_period
+        self.epoch = uuid.uuid4().hex
+        self.version = 0
+        self.table = []
+        self.last_snapshot = None
+
+    def publish(self, table):
+        """Publish the new table if needed, return True if it differs from the previous one."""
+        changed = diff_tables(self.table, table)
+        self.table = table
+        if changed is not None:
+            self.version += 1
+        now = time.time()
+        if self.last_snapshot is None or now - self.last_snapshot > self.snapshot_period:
+            self.last_snapshot = now
+            self.send({"kind": "full", "epoch": self.epoch, "version": self.version, "table": table})
+        elif changed is not None:
+            self.send({"kind": "delta", "epoch": self.epoch, "version": self.version, "base": self.version - 1,
+                       "order": [job["id"] for job in table], "changed": changed})
+        return changed is not None
+
+    def send(self, msg):
+        if self.socket:
+            self.socket.send_string("JOBTABLE", flags=zmq.SNDMORE)
+            self.socket.send_json(msg)
+
+
+class JobTable:
+    def __init__(self):
+        """Subscriber copy of the job table, kept in sync from JOBTABLE messages."""
+        self.epoch = None
+        self.version = None
+        self.jobs = {}
+        self.order = []
+
+    @property
+    def table(self):
+        return [self.jobs[job_id] for job_id in self.order]
+
+    def apply(self, msg):
+        """Apply a JOBTABLE message, return True if the table was updated.
+
+        Deltas that do not follow the current version are dropped until the next full snapshot."""
+        if msg["kind"] == "full":
+            self.epoch = msg["epoch"]
+            self.version = msg["version"]
+            self.jobs = {job["id"]: job for job in msg["table"]}
+            self.order = [job["id"] for job in msg["table"]]
+            return True
+        if msg["epoch"] != self.epoch or msg["base"] != self.version:
+            return False
+        jobs = {job_id: self.jobs[job_id] for job_id in msg["order"] if job_id in self.jobs}
+        jobs.update({job["id"]: job for job in msg["changed"]})
+        self.jobs = jobs
+        self.order = msg["order"]
+        self.version = msg["version"]
+        return True
+
+    def apply_all(self, msgs):
+        """Apply a batch of JOBTABLE messages, skipping everything older than the last full snapshot."""
+        full = [i for i, msg in enumerate(msgs) if msg["kind"] == "full"]
+        if full:
+            msgs = msgs[full[-1]:]
+        updated = False
+        for msg in msgs:
+            updated = self.apply(msg) or updated
+        return updated
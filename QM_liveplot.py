@@ -0,0 +1,130 @@
+import threading
+import time
+
+_painter = None
+_painter_lock = threading.Lock()
+
+
+class Painter(threading.Thread):
+    def __init__(self):
+        """Redraws the live views of the kernel, one at a time and at most max_fps times per second each."""
+        super().__init__(daemon=True)
+        self.cond = threading.Condition()
+        self.dirty = set()
+        self.start()
+
+    def request(self, view):
+        with self.cond:
+            self.dirty.add(view)
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.dirty:
+                    self.cond.wait()
+                now = time.monotonic()
+                ready = [view for view in self.dirty if view.next_draw <= now]
+                if not ready:
+                    self.cond.wait(min(view.next_draw for view in self.dirty) - now)
+                    continue
+                self.dirty.difference_update(ready)
+            for view in ready:
+                try:
+                    view.draw()
+                except Exception:
+                    # The figure was closed or cleared meanwhile
+                    pass
+
+
+def get_painter():
+    """Painter shared by all the live views of the kernel, started on first use."""
+    global _painter
+    with _painter_lock:
+        if _painter is None:
+            _painter = Painter()
+    return _painter
+
+
+class LiveView:
+    def __init__(self, fig, max_fps=10.):
+        """Live plot of the results of a running job.
+
+        Lines are bound to stream names. watch() polls count_so_far and only fetches a stream when it
+        has advanced, transforms (e.g. smoothing) run on the calling thread, and the figure is redrawn
+        by the shared Painter thread, blitting the lines when the canvas supports it."""
+        self.fig = fig
+        self.min_interval = 1. / max_fps
+        self.next_draw = 0.
+        self.bindings = []
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.background = None
+        self.blit = getattr(fig.canvas, "supports_blit", False)
+        fig.canvas.mpl_connect("draw_event", self.on_draw)
+
+    def bind(self, line, name, transform=None):
+        """Update the ydata of line with the stream name, passed through transform if given."""
+        line.set_animated(self.blit)
+        self.bindings.append((line, name, transform))
+
+    def clear(self):
+        """Remove all bindings, to be called when the axes are cleared."""
+        with self.lock:
+            self.bindings = []
+            self.pending = {}
+        self.background = None
+
+    def redraw(self):
+        """Full redraw, e.g. after changing the axes."""
+        self.fig.canvas.draw_idle()
+
+    def watch(self, job, period=0.2, stop=None):
+        """Follow job while it is running and stop() is false, updating the bound lines."""
+        handles = {name: job.result_handles.get(name) for line, name, transform in self.bindings}
+        counts = dict.fromkeys(handles, 0)
+        while job.status == "running" and not (stop and stop()):
+            self.poll(handles, counts)
+            time.sleep(period)
+        try:
+            self.poll(handles, counts)
+        except:
+            pass
+
+    def poll(self, handles, counts):
+        fetched = {}
+        for name, handle in handles.items():
+            count = handle.count_so_far()
+            if count > counts[name]:
+                counts[name] = count
+                fetched[name] = handle.fetch(0)
+        if not fetched:
+            return
+        data = {line: transform(fetched[name]) if transform else fetched[name]
+                for line, name, transform in self.bindings if name in fetched}
+        with self.lock:
+            self.pending.update(data)
+        get_painter().request(self)
+
+    def draw_lines(self):
+        for line, name, transform in list(self.bindings):
+            line.axes.draw_artist(line)
+
+    def on_draw(self, event):
+        if self.blit:
+            self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+            self.draw_lines()
+
+    def draw(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        self.next_draw = time.monotonic() + self.min_interval
+        for line, y in pending.items():
+            line.set_ydata(y)
+        canvas = self.fig.canvas
+        if self.blit and self.background is not None:
+            canvas.restore_region(self.background)
+            self.draw_lines()
+            canvas.blit(self.fig.bbox)
+        else:
+            canvas.draw_idle()
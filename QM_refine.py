@@ -0,0 +1,111 @@
+import heapq
+import numpy as np
+
+
+class AdaptiveMap:
+    def __init__(self, x, y, step=(8, 4), noise=0.):
+        """2D map on the grid x (rows) by y (columns), measured adaptively.
+
+        The map starts from a coarse grid, one point every step points. It is then refined as a
+        quadtree: the cells whose corner values differ the most, weighted by the square root of
+        their size, are split first. Differences below 2*noise are taken as flat.
+        map() interpolates the measured points back onto the full grid."""
+        self.x = np.asarray(x)
+        self.y = np.asarray(y)
+        self.noise = noise
+        self.values = np.full((len(self.x), len(self.y)), np.nan)
+        rows = np.unique(np.r_[np.arange(0, len(self.x), step[0]), len(self.x) - 1])
+        cols = np.unique(np.r_[np.arange(0, len(self.y), step[1]), len(self.y) - 1])
+        # Leaf cells (i0, i1, j0, j1), corners included, waiting for their corners to be measured
+        self.waiting = [(i0, i1, j0, j1) for i0, i1 in zip(rows[:-1], rows[1:]) for j0, j1 in zip(cols[:-1], cols[1:])]
+        self.leaves = []
+        self.pending = set((i, j) for i in rows for j in cols)
+
+    @property
+    def measured(self):
+        return np.isfinite(self.values)
+
+    def fraction(self):
+        """Fraction of the full grid measured so far."""
+        return self.measured.mean()
+
+    def loss(self, cell):
+        i0, i1, j0, j1 = cell
+        if i1 - i0 < 2 and j1 - j0 < 2:
+            return -np.inf
+        corners = self.values[[i0, i0, i1, i1], [j0, j1, j0, j1]]
+        return max(corners.max() - corners.min() - 2 * self.noise, 0.) * np.sqrt((i1 - i0) * (j1 - j0))
+
+    def split(self, cell):
+        i0, i1, j0, j1 = cell
+        rows = [i0, (i0 + i1) // 2, i1] if i1 - i0 >= 2 else [i0, i1]
+        cols = [j0, (j0 + j1) // 2, j1] if j1 - j0 >= 2 else [j0, j1]
+        return [(a, b, c, d) for a, b in zip(rows[:-1], rows[1:]) for c, d in zip(cols[:-1], cols[1:])]
+
+    def next_points(self, n):
+        """Row and column indices of up to n new points to measure, empty when nothing is left to refine.
+
+        The first call returns the coarse grid."""
+        if self.pending:
+            points = sorted(self.pending)
+            return np.array([i for i, j in points], dtype=int), np.array([j for i, j in points], dtype=int)
+        self.promote()
+        measured = self.measured
+        heap = [(-self.loss(cell), cell) for cell in self.leaves]
+        heapq.heapify(heap)
+        new, keep = set(), []
+        while heap and len(new) < n:
+            loss, cell = heapq.heappop(heap)
+            if loss == np.inf or loss >= 0:
+                keep.append(cell)
+                break
+            for child in self.split(cell):
+                self.waiting.append(child)
+                new.update((i, j) for i in child[:2] for j in child[2:] if not measured[i, j])
+        self.leaves = keep + [cell for loss, cell in heap]
+        self.pending = new
+        return self.next_points(n) if new else (np.empty(0, dtype=int), np.empty(0, dtype=int))
+
+    def add(self, rows, cols, values):
+        """Store measured values at the given row and column indices."""
+        self.values[rows, cols] = values
+        self.pending.difference_update(zip(np.asarray(rows).tolist(), np.asarray(cols).tolist()))
+
+    def promote(self):
+        """Move the waiting cells whose corners are all measured to the leaves."""
+        measured = self.measured
+        waiting = []
+        for cell in self.waiting:
+            i0, i1, j0, j1 = cell
+            (self.leaves if measured[[i0, i0, i1, i1], [j0, j1, j0, j1]].all() else waiting).append(cell)
+        self.waiting = waiting
+
+    def map(self):
+        """Full resolution map, bilinear interpolation of the corners of every leaf cell."""
+        self.promote()
+        out = np.full(self.values.shape, np.nan)
+        for i0, i1, j0, j1 in self.leaves:
+            u = np.linspace(0, 1, i1 - i0 + 1)[:, None]
+            v = np.linspace(0, 1, j1 - j0 + 1)[None, :]
+            a, b, c, d = self.values[[i0, i0, i1, i1], [j0, j1, j0, j1]]
+            out[i0:i1 + 1, j0:j1 + 1] = (1 - u) * ((1 - v) * a + v * b) + u * ((1 - v) * c + v * d)
+        measured = self.measured
+        out[measured] = self.values[measured]
+        return out
+
+
+def refine(measure, x, y, step=(8, 4), noise=0., batch=0.25, max_fraction=0.3):
+    """Measure a 2D map adaptively.
+
+    measure(x_values, y_values) returns the values at the given points, typically by running a
+    short job. Each job measures about batch times the points measured so far, until no cell is
+    worth refining or max_fraction of the grid has been measured. Returns the AdaptiveMap."""
+    grid = AdaptiveMap(x, y, step, noise)
+    rows, cols = grid.next_points(0)
+    while len(rows):
+        grid.add(rows, cols, measure(grid.x[rows], grid.y[cols]))
+        budget = int(max_fraction * grid.values.size) - grid.measured.sum()
+        if budget <= 0:
+            break
+        rows, cols = grid.next_points(min(max(int(batch * grid.measured.sum()), 1), budget))
+    return grid
@@ -0,0 +1,160 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from QM_archive import Archive
+import QM_fit
+
+# Axes as stored by the notebooks: durations in clock cycles (4 ns), detuning in Hz, phases in turns
+
+
+def fit_t1(archive):
+    t = archive.axes["durations"] * 4e-3
+    (a, tau, ofs), (a_err, tau_err, ofs_err) = QM_fit.fit_exp(t, -np.asarray(archive["Sz"]))
+    return {"T1": tau, "T1_err": tau_err, "amplitude": a, "offset": ofs}
+
+
+def fit_t2(archive):
+    t = archive.axes["durations"] * 4e-3
+    phase = archive.axes["phase_2_pi"] if "phase_2_pi" in archive.axes else archive.axes["phase"]
+    popt, perr = QM_fit.fit_phase(phase, np.asarray(archive["Sz"]))
+    (a, tau), (a_err, tau_err) = QM_fit.fit_exp(t, popt[:, 0], offset=False)
+    return {"T2": tau, "T2_err": tau_err, "amplitude": a}
+
+
+def fit_chevron(archive):
+    t = archive.axes["durations"] * 4e-3
+    detuning = archive.axes["detuning"] / 1e6
+    f_rabi, center, popt, perr = QM_fit.fit_chevron(t, detuning, np.asarray(archive["Sz"]))
+    return {"f_rabi": f_rabi * 1e6, "center": center * 1e6}
+
+
+MODELS = {"T1": fit_t1, "T2": fit_t2, "chevron": fit_chevron}
+
+
+def model_of(archive):
+    """Model of an archive, from its model info if given, else from its sweep axes."""
+    if "model" in archive.meta:
+        return archive.meta["model"]
+    axes = set(archive.axes)
+    if {"durations", "detuning"} <= axes:
+        return "chevron"
+    if "durations" in axes and axes & {"phase", "phase_2_pi"}:
+        return "T2"
+    if "durations" in axes:
+        return "T1"
+    return None
+
+
+def find_archives(root):
+    return sorted(dirpath for dirpath, dirnames, filenames in os.walk(root) if "meta.json" in filenames)
+
+
+def signature(path):
+    """Sizes and modification times of the files of an archive, to skip hashing unchanged archives."""
+    return sorted([name, st.st_size, st.st_mtime_ns] for name in os.listdir(path)
+                  for st in [os.stat(os.path.join(path, name))] if not name.endswith(".tmp"))
+
+
+def content_hash(path):
+    h = hashlib.sha256()
+    for name in sorted(os.listdir(path)):
+        if name.endswith(".tmp"):
+            continue
+        h.update(name.encode())
+        with open(os.path.join(path, name), "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+def refit(path):
+    """Fit one archive, returns a row of the summary table."""
+    row = {}
+    try:
+        archive = Archive(path)
+        row.update(created=archive.meta.get("created"), user=archive.meta.get("user"), model=model_of(archive))
+        if row["model"] not in MODELS:
+            raise ValueError(f"unknown model {row['model']}")
+        row.update({k: float(v) for k, v in MODELS[row["model"]](archive).items()})
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    return row
+
+
+def load_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"files": {}, "results": {}}
+
+
+def save_cache(cache, path):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp, path)
+
+
+def write_summary(rows, path):
+    """CSV table of the fitted parameters, sorted by creation time."""
+    columns = ["path", "created", "user", "model"]
+    columns += sorted({k for row in rows for k in row} - set(columns) - {"error"}) + ["error"]
+    rows = sorted(rows, key=lambda row: row.get("created") or 0.)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        for row in rows:
+            row = dict(row)
+            if row.get("created"):
+                row["created"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["created"]))
+            writer.writerow(row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit again all the archived datasets of a directory.")
+    parser.add_argument("root", help="directory searched for archives (see QM_archive)")
+    parser.add_argument("-o", "--output", default="refit_summary.csv", help="summary table")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of processes, all cores by default")
+    parser.add_argument("--cache", default=None, help="cache of the fit results, ROOT/refit_cache.json by default")
+    parser.add_argument("--force", action="store_true", help="ignore the cache")
+    args = parser.parse_args(argv)
+    cache_path = args.cache or os.path.join(args.root, "refit_cache.json")
+    cache = {"files": {}, "results": {}} if args.force else load_cache(cache_path)
+
+    start = time.perf_counter()
+    paths = find_archives(args.root)
+    hashes, changed = {}, []
+    for path in paths:
+        sig = signature(path)
+        entry = cache["files"].get(path)
+        if entry and entry[0] == sig:
+            hashes[path] = entry[1]
+        else:
+            changed.append((path, sig))
+    with ProcessPoolExecutor(args.jobs) as pool:
+        for (path, sig), h in zip(changed, pool.map(content_hash, [path for path, sig in changed])):
+            hashes[path] = h
+            cache["files"][path] = [sig, h]
+        todo = sorted({h: path for path, h in hashes.items() if h not in cache["results"]}.items())
+        for (h, path), row in zip(todo, pool.map(refit, [path for h, path in todo], chunksize=4)):
+            cache["results"][h] = row
+    elapsed = time.perf_counter() - start
+
+    cache["files"] = {path: cache["files"][path] for path in paths}
+    cache["results"] = {h: cache["results"][h] for h in set(hashes.values())}
+    save_cache(cache, cache_path)
+    rows = [dict(cache["results"][hashes[path]], path=os.path.relpath(path, args.root)) for path in paths]
+    write_summary(rows, args.output)
+    errors = sum("error" in row for row in rows)
+    print(f"{len(paths)} archives, {len(todo)} fitted, {len(paths)-len(todo)} cached, {errors} errors "
+          f"in {elapsed:.2f} s ({len(paths)/max(elapsed, 1e-9):.1f} files/s), summary in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+from collections import OrderedDict
+
+
+class JobRegistry:
+    def __init__(self, capacity=10000):
+        """Jobs announced by the clients, indexed by (id, qm_id, status).
+
+        Once capacity is reached the least recently used registrations are evicted."""
+        self.capacity = capacity
+        self.jobs = OrderedDict()
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def add(self, job):
+        key = (job["id"], job["qm_id"], job["status"])
+        self.jobs[key] = job
+        self.jobs.move_to_end(key)
+        while len(self.jobs) > self.capacity:
+            self.jobs.popitem(last=False)
+
+    def get(self, job_id, qm_id, status):
+        """Return the registered job, None if it is unknown."""
+        key = (job_id, qm_id, status)
+        job = self.jobs.get(key)
+        if job is not None:
+            self.jobs.move_to_end(key)
+        return job
@@ -0,0 +1,125 @@
+import time
+import threading
+
+# QM address
+QM_Router_IP = "129.175.113.167"
+cluster_name = "Cluster_1"
+
+
+class QMSession:
+    def __init__(self, host=QM_Router_IP, cluster_name=cluster_name, retries=5, backoff=0.5, max_backoff=8.):
+        """Process-wide connection to the QM router.
+
+        The QuantumMachinesManager is only created on first use of the qmm property,
+        failed connections are retried with an exponential backoff."""
+        self.host = host
+        self.cluster_name = cluster_name
+        self.octave_calibration_db_path = None
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._qmm = None
+        self._qm = None
+        self._lock = threading.RLock()
+
+    @property
+    def connected(self):
+        return self._qmm is not None
+
+    @property
+    def qmm(self):
+        """QuantumMachinesManager of the session, connected on first use."""
+        qmm = self._qmm
+        if qmm is None:
+            with self._lock:
+                if self._qmm is None:
+                    self._qmm = self._connect()
+                qmm = self._qmm
+        return qmm
+
+    def _connect(self):
+        # Imported here, the qm package alone takes seconds to import
+        from qm import QuantumMachinesManager
+        delay = self.backoff
+        for attempt in range(self.retries):
+            try:
+                return QuantumMachinesManager(host=self.host, cluster_name=self.cluster_name, log_level="ERROR",
+                                              octave_calibration_db_path=self.octave_calibration_db_path)
+            except Exception:
+                if attempt == self.retries - 1:
+                    raise
+                time.sleep(delay)
+                delay = min(2 * delay, self.max_backoff)
+
+    def configure(self, **kwargs):
+        """Change connection parameters, reconnecting on next use if any of them changed."""
+        with self._lock:
+            changed = False
+            for k, v in kwargs.items():
+                if not hasattr(self, k):
+                    raise AttributeError(f"Unknown session parameter {k}")
+                if getattr(self, k) != v:
+                    setattr(self, k, v)
+                    changed = True
+            if changed:
+                self.reconnect()
+
+    def reconnect(self):
+        """Drop the current connection, the next use of qmm connects again."""
+        with self._lock:
+            self._qmm = None
+            self._qm = None
+
+    def get_qm(self):
+        """Handle of the open QM, cached until invalidated."""
+        qm = self._qm
+        if qm is None:
+            with self._lock:
+                if self._qm is None:
+                    qm_list = self.qmm.list_open_qms()
+                    self._qm = self.qmm.get_qm(qm_list[0])
+                qm = self._qm
+        return qm
+
+    def invalidate_qm(self):
+        """Forget the cached QM handle, the next get_qm asks the router again."""
+        with self._lock:
+            self._qm = None
+
+    def open_qm(self, config):
+        """Open a new QM and make it the cached handle."""
+        with self._lock:
+            self._qm = self.qmm.open_qm(config)
+            return self._qm
+
+    def _get_qm_reconnecting(self):
+        """get_qm, connecting again with backoff if the current connection to the router is lost."""
+        try:
+            return self.get_qm()
+        except Exception:
+            if self._qmm is None:
+                raise
+            self.reconnect()
+            return self.get_qm()
+
+    def call_qm(self, func):
+        """Return func(qm) for the cached QM handle.
+
+        If the call fails and the router now reports a different QM (the QM was reopened
+        by QMloader, possibly from another kernel), or the connection to the router had to be
+        established again, the call is retried once on the new handle."""
+        qm = self._get_qm_reconnecting()
+        qmm = self._qmm
+        try:
+            return func(qm)
+        except Exception:
+            with self._lock:
+                if self._qm is qm:
+                    self._qm = None
+            new_qm = self._get_qm_reconnecting()
+            if new_qm.id == qm.id and self._qmm is qmm:
+                raise
+            return func(new_qm)
+
+
+session = QMSession()
@@ -0,0 +1,130 @@
+import contextlib
+import inspect
+import numpy as np
+
+
+class Axis:
+    def __init__(self, name, values, setup=None, label=None, dtype=None):
+        """Swept QUA variable.
+
+        values are the swept values. dtype is the QUA type of the variable, int or fixed; by default
+        int for integer arrays and fixed otherwise. Fixed values must lie in [-8, 8), frequencies and
+        durations from np.linspace need dtype=int. setup(var) is called once per value at the level
+        of this loop, e.g. lambda fs: update_frequency('qubit', fs), instead of in the innermost body.
+        The body must then not change what setup set, or restore it."""
+        self.name = name
+        self.values = np.asarray(values)
+        self.setup = setup
+        self.label = label or name
+        self.integer = np.issubdtype(self.values.dtype, np.integer) if dtype is None else dtype is int
+        if not self.integer and not np.all((self.values >= -8) & (self.values < 8)):
+            raise ValueError(f"Values of axis {name} out of the range [-8, 8) of fixed, use integer values or dtype=int")
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def evenly_spaced(self):
+        step = np.diff(self.values)
+        return len(self.values) < 3 or np.allclose(step, step[0], rtol=1e-9, atol=0)
+
+
+class Sweep:
+    def __init__(self, *axes, n_avg=1, reorder=True):
+        """Nested sweep of axes averaged n_avg times, generating the QUA loops and the stream processing.
+
+        Axes are given outer to inner. With reorder, the axes with a setup are moved outside the
+        axes without one, so that setup runs as rarely as possible. Results are returned in the
+        order the axes are given, whatever the loop order."""
+        self.axes = list(axes)
+        self.n_avg = n_avg
+        self.order = sorted(self.axes, key=lambda axis: axis.setup is None) if reorder else list(self.axes)
+
+    @property
+    def shape(self):
+        return tuple(len(axis) for axis in self.axes)
+
+    @property
+    def loop_shape(self):
+        return tuple(len(axis) for axis in self.order)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def grid(self):
+        """Values of every axis on the full grid, {name: array of shape self.shape}."""
+        return dict(zip([axis.name for axis in self.axes],
+                        np.meshgrid(*[axis.values for axis in self.axes], indexing="ij")))
+
+    def estimate(self, body_time):
+        """Run time in seconds, body_time(**values) being the time of one pass through the body.
+
+        body_time only receives the axes named in its signature, e.g. lambda t: t*4e-9 + 2e-6."""
+        names = inspect.signature(body_time).parameters
+        times = body_time(**{k: v for k, v in self.grid().items() if k in names})
+        return float(np.sum(np.broadcast_to(times, self.shape))) * self.n_avg
+
+    @contextlib.contextmanager
+    def loop(self, average=True):
+        """Open the averaging loop and the loops of the axes, yield {axis name: QUA variable}.
+
+        With average=False the averaging loop is left to the caller."""
+        from qm.qua import declare, fixed, for_, for_each_
+        from qualang_tools.loops import from_array
+        variables = {axis.name: declare(int if axis.integer else fixed) for axis in self.order}
+        with contextlib.ExitStack() as stack:
+            if average:
+                n = declare(int)
+                stack.enter_context(for_(n, 0, n < self.n_avg, n + 1))
+            for axis in self.order:
+                var = variables[axis.name]
+                values = np.round(axis.values).astype(int) if axis.integer else axis.values.astype(float)
+                if axis.evenly_spaced:
+                    stack.enter_context(for_(*from_array(var, values)))
+                else:
+                    stack.enter_context(for_each_(var, values.tolist()))
+                if axis.setup:
+                    axis.setup(var)
+            yield variables
+
+    def save(self, stream, name):
+        """Buffer stream along the loops, average it and save it as name, within stream_processing()."""
+        for axis in reversed(self.order):
+            stream = stream.buffer(len(axis))
+        from qm.qua import FUNCTIONS
+        stream.buffer(self.n_avg).map(FUNCTIONS.average(0)).save(name)
+
+    def arrange(self, data):
+        """Reorder data from the loop order to the order of the axes."""
+        data = np.asarray(data).reshape(self.loop_shape)
+        return np.transpose(data, [self.order.index(axis) for axis in self.axes])
+
+    def allocate(self, *names):
+        """Host arrays of the results names, filled with NaN until set."""
+        return SweepData(self, names)
+
+
+class SweepData:
+    def __init__(self, sweep, names):
+        """Results of a sweep, with the values and labels of its axes."""
+        self.sweep = sweep
+        self.axes = {axis.name: axis.values for axis in sweep.axes}
+        self.labels = {axis.name: axis.label for axis in sweep.axes}
+        self.arrays = {name: np.full(sweep.shape, np.nan) for name in names}
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def keys(self):
+        return self.arrays.keys()
+
+    def set(self, name, data):
+        """Store data fetched from the job, in loop order."""
+        self.arrays[name][...] = self.sweep.arrange(data)
+
+    def fetch(self, job):
+        """Fetch all the results of a QM.Job."""
+        for name, data in zip(self.arrays, job.get_results(*self.arrays)):
+            self.set(name, data)
+        return self
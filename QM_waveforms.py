@@ -0,0 +1,76 @@
+import functools
+import json
+import numpy as np
+
+
+@functools.lru_cache(maxsize=256)
+def _gaussian(amplitude, length, sigma):
+    wf = amplitude * np.exp(-(np.arange(length) - length / 2) ** 2 / (2 * sigma ** 2))
+    wf.flags.writeable = False
+    return wf
+
+
+def gaussian(amplitude, length, sigma):
+    """Gaussian of length samples centered on length/2, standard deviation sigma in samples."""
+    return _gaussian(float(amplitude), int(length), float(sigma))
+
+
+@functools.lru_cache(maxsize=256)
+def _drag(amplitude, length, sigma, alpha, anharmonicity, detuning):
+    I = _gaussian(amplitude, length, sigma)
+    # Derivative of the Gaussian per ns, divided by the detuning from the 1-2 transition in rad/ns
+    Q = alpha * (-(np.arange(length) - length / 2) / sigma ** 2) * I / (2 * np.pi * (anharmonicity - detuning) * 1e-9)
+    Q.flags.writeable = False
+    return I, Q
+
+
+def drag(amplitude, length, sigma, alpha, anharmonicity, detuning=0.):
+    """I and Q of a DRAG Gaussian pulse, anharmonicity and detuning in Hz."""
+    return _drag(float(amplitude), int(length), float(sigma), float(alpha), float(anharmonicity), float(detuning))
+
+
+# Named waveform library, see waveform()
+LIBRARY = {"gaussian": gaussian, "drag": drag}
+
+
+def waveform(name, **params):
+    """Waveform of the library generated with params, generations are cached."""
+    return LIBRARY[name](**params)
+
+
+def compile_waveforms(config, atol=1e-12):
+    """Compact the waveforms of a configuration.
+
+    Arbitrary waveforms whose samples are all equal become constant waveforms, then identical
+    waveforms are merged into the first one declared and the pulses are pointed to it.
+    Overridable waveforms are left as they are. The configuration is not modified, a new one
+    is returned."""
+    waveforms = {}
+    for name, wf in config.get("waveforms", {}).items():
+        samples = wf.get("samples")
+        if wf.get("type") == "arbitrary" and set(wf) == {"type", "samples"} and len(samples):
+            samples = np.asarray(samples, dtype=float)
+            if np.all(np.abs(samples - samples[0]) <= atol):
+                wf = {"type": "constant", "sample": float(samples[0])}
+        waveforms[name] = wf
+    canonical, renamed = {}, {}
+    for name, wf in waveforms.items():
+        key = json.dumps(wf, sort_keys=True, default=lambda x: np.asarray(x).tolist())
+        renamed[name] = canonical.setdefault(key, name)
+    pulses = {}
+    for name, pulse in config.get("pulses", {}).items():
+        pulse = dict(pulse)
+        if "waveforms" in pulse:
+            pulse["waveforms"] = {k: renamed.get(v, v) for k, v in pulse["waveforms"].items()}
+        pulses[name] = pulse
+    config = dict(config)
+    config["waveforms"] = {name: wf for name, wf in waveforms.items() if renamed[name] == name}
+    if "pulses" in config:
+        config["pulses"] = pulses
+    return config
+
+
+def waveform_samples(config):
+    """Number of waveforms and total number of arbitrary samples of a configuration."""
+    waveforms = config.get("waveforms", {})
+    return len(waveforms), sum(len(wf.get("samples", ())) for wf in waveforms.values() if wf.get("type") == "arbitrary")
@@ -0,0 +1,43 @@
+"""Adaptive averaging with early stop against a simulated decay source.
+
+The LifeTime and DephasingTime acquisitions (n_avg = 10000) are simulated as blocks of 200
+single shots. QM_adaptive.run_adaptive stops the job once the fitted T1/T2 is known within the
+target relative error. The averages used and the OPX time saved are printed, with the fitted
+value against the true one.
+
+Run:  python benchmarks/bench_adaptive.py"""
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import QM_adaptive
+import QM_fit
+
+n_avg, shots = 10000, 200
+
+
+def run(name, expectation, fit, truth, loop_time, target, seed):
+    job = QM_adaptive.SimulatedJob(expectation, shots=shots, blocks=n_avg // shots, block_time=0.002, seed=seed)
+    averager = QM_adaptive.run_adaptive(job, "Sz_blocks", QM_adaptive.AdaptiveAverager(fit, target), period=0.002)
+    averages = averager.blocks * shots
+    print(f"{name:4s} {target:6.0%} {averages:9d} {averager.reason or 'completed':>10s} "
+          f"{averager.value:8.2f} ± {averager.error:5.2f} {truth:6.1f}   {(n_avg-averages)*loop_time:8.1f} s saved")
+
+
+if __name__ == "__main__":
+    print(f"{'':4s} {'target':>6s} {'averages':>9s} {'stop':>10s} {'fit':>16s} {'true':>6s}")
+    t1_durations = np.arange(5000 // 4, 150000 // 4, 5000 // 4)
+    t = t1_durations * 4e-3
+    t1_loop = sum(t1_durations * 4e-9 + 2e-6)
+    for target in (0.05, 0.02, 0.01):
+        for seed in range(3):
+            run("T1", -QM_fit.exp_decay(t, 0.7, 25., -0.35), QM_adaptive.t1_fit(t), 25., t1_loop, target, seed)
+    t2_durations = np.arange(100 // 4, 50000 // 4, 4000 // 4)
+    phase = np.linspace(0, 1, 20)
+    t = t2_durations * 4e-3
+    t2_loop = sum(t2_durations * 4e-9 + 2e-6) * len(phase)
+    expectation = QM_fit.cosine_phase(phase, 0.4 * np.exp(-t / 12.)[:, None], 0., 0.3)
+    for target in (0.05, 0.02, 0.01):
+        for seed in range(3):
+            run("T2", expectation, QM_adaptive.t2_fit(t, phase), 12., t2_loop, target, seed)
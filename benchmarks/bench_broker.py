@@ -0,0 +1,117 @@
+"""Fair-share broker against plain FIFO submission on a simulated OPX queue.
+
+A class of students submits short jobs while two heavy users fire batches of long
+jobs. The fake queue runs one job at a time for its simulated duration, the clock
+advances in one second steps. Brokered jobs are released the way
+QMM.QueueMonitor.dispatch does it: one at a time, whenever nothing is pending.
+Rejected submissions (quota) are retried 30 s later.
+
+Run:  python benchmarks/bench_broker.py [seed]"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from QM_broker import FairShareScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+
+class FakeQueue:
+    def __init__(self, clock):
+        """OPX queue stand-in running one job at a time for its simulated duration."""
+        self.clock = clock
+        self.pending = []
+        self.running = None
+        self.end = None
+        self.busy = 0.
+
+    def add(self, job):
+        job["queued"] = self.clock()
+        self.pending.append(job)
+
+    def step(self, dt):
+        """Advance by dt seconds, return the jobs that finished and started, if any."""
+        finished = started = None
+        if self.running:
+            self.busy += dt
+            if self.clock() >= self.end:
+                finished, self.running = self.running, None
+        if self.running is None and self.pending:
+            self.running = started = self.pending.pop(0)
+            self.running["start"] = self.clock()
+            self.end = self.clock() + self.running["duration"]
+        return finished, started
+
+
+def workload(rng, horizon=3*3600):
+    jobs = []
+    for i in range(15):
+        for _ in range(rng.randint(3, 8)):
+            jobs.append({"user": f"student{i}", "submit": rng.uniform(0, horizon), "duration": rng.uniform(10, 60)})
+    for i in range(2):
+        t = rng.uniform(0, horizon / 4)
+        for _ in range(12):
+            jobs.append({"user": f"heavy{i}", "submit": t, "duration": rng.uniform(200, 400)})
+    for k, job in enumerate(jobs):
+        job["token"] = k
+        job["estimate"] = job["duration"] * rng.uniform(0.8, 1.2)
+    return sorted(jobs, key=lambda job: job["submit"])
+
+
+def simulate(jobs, brokered):
+    clock = Clock()
+    queue = FakeQueue(clock)
+    broker = FairShareScheduler(clock=clock)
+    todo = [dict(job) for job in jobs]
+    done = []
+    while len(done) < len(jobs):
+        while todo and todo[0]["submit"] <= clock.now:
+            job = todo.pop(0)
+            if not brokered:
+                queue.add(job)
+            elif broker.submit(job["token"], job["user"], job["estimate"]):
+                broker.waiting[job["token"]]["job"] = job
+            else:
+                job["submit"] += 30
+                todo.append(job)
+                todo.sort(key=lambda job: job["submit"])
+        finished, started = queue.step(1.)
+        if finished:
+            broker.done(finished["token"])
+            done.append(finished)
+        if started:
+            broker.started(started["token"])
+        if brokered and not queue.pending:
+            request = broker.release()
+            if request:
+                queue.add(request["job"])
+        clock.now += 1.
+    return done, clock.now, queue.busy
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+if __name__ == "__main__":
+    rng = random.Random(int(sys.argv[1]) if len(sys.argv) > 1 else 0)
+    jobs = workload(rng)
+    print(f"{len(jobs)} jobs, {sum(job['duration'] for job in jobs)/3600:.2f} h of machine time")
+    for brokered in (False, True):
+        done, makespan, busy = simulate(jobs, brokered)
+        # Waiting time counted from the first submission attempt
+        first = {job["token"]: job["submit"] for job in jobs}
+        waits = [job["start"] - first[job["token"]] for job in done]
+        short = [w for w, job in zip(waits, done) if job["user"].startswith("student")]
+        heavy = [w for w, job in zip(waits, done) if job["user"].startswith("heavy")]
+        print(f"{'fair-share broker' if brokered else 'FIFO':18s} throughput {3600*len(done)/makespan:5.1f} jobs/h"
+              f"  utilisation {busy/makespan:4.0%}  p95 wait: all {percentile(waits, .95):6.0f}s"
+              f"  students {percentile(short, .95):6.0f}s  heavy users {percentile(heavy, .95):6.0f}s")
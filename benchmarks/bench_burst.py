@@ -0,0 +1,86 @@
+"""Registration latency of JOB messages when many clients submit at once.
+
+N client threads publish a JOB message each to a local SUB socket standing in for
+QueueMonitor.socket1. The receiving loop mimics QueueMonitor.run: poll for up to
+200 ms, receive, then spend `tick` seconds in parse_queue. The loop that receives a
+single message per wakeup is compared to the drain-all loop. Messages not received
+within `timeout` seconds are reported as lost.
+
+Run:  python benchmarks/bench_burst.py [clients] [tick] [timeout]"""
+import os
+import statistics
+import sys
+import threading
+import time
+import zmq
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from QM_jobtable import recv_all
+
+
+def client(context, endpoint, index, start):
+    socket = context.socket(zmq.PUB)
+    socket.connect(endpoint)
+    start.wait()
+    socket.send_string("JOB", flags=zmq.SNDMORE)
+    socket.send_json({"status": "pending", "time": time.time(), "user": f"student{index}", "id": index, "qm_id": "qm"})
+    # Leave the message time to get out before closing
+    time.sleep(1.)
+    socket.close(linger=0)
+
+
+def monitor(socket, n, tick, drain, timeout):
+    poller = zmq.Poller()
+    poller.register(socket, zmq.POLLIN)
+    latencies = []
+    deadline = time.time() + timeout
+    while len(latencies) < n and time.time() < deadline:
+        evts = dict(poller.poll(timeout=200))
+        if socket in evts:
+            if drain:
+                msgs = recv_all(socket)
+            else:
+                topic = socket.recv_string()
+                msgs = [(topic, socket.recv_json())]
+            now = time.time()
+            latencies.extend(now - job["time"] for topic, job in msgs)
+        # parse_queue
+        time.sleep(tick)
+    return latencies
+
+
+def burst(n, tick, drain, timeout):
+    context = zmq.Context()
+    socket = context.socket(zmq.SUB)
+    socket.bind("tcp://127.0.0.1:*")
+    socket.subscribe("JOB")
+    endpoint = socket.getsockopt_string(zmq.LAST_ENDPOINT)
+    start = threading.Event()
+    clients = [threading.Thread(target=client, args=(context, endpoint, i, start)) for i in range(n)]
+    for c in clients:
+        c.start()
+    # Let the subscriptions propagate to every publisher
+    time.sleep(0.5)
+    start.set()
+    latencies = monitor(socket, n, tick, drain, timeout)
+    for c in clients:
+        c.join()
+    socket.close(linger=0)
+    context.term()
+    return latencies
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    tick = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    timeout = float(sys.argv[3]) if len(sys.argv) > 3 else 30.
+    for drain in (False, True):
+        latencies = sorted(burst(n, tick, drain, timeout))
+        name = "drain-all" if drain else "one per wakeup"
+        lost = f"   {n - len(latencies)} lost" if len(latencies) < n else ""
+        if not latencies:
+            print(f"{name:15s} {n} clients: no message received within {timeout:.0f} s")
+            continue
+        p95 = latencies[int(0.95 * (len(latencies) - 1))]
+        print(f"{name:15s} {n} clients: "
+              f"median {1e3*statistics.median(latencies):7.1f} ms   p95 {1e3*p95:7.1f} ms   max {1e3*latencies[-1]:7.1f} ms{lost}")
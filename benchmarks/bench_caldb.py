@@ -0,0 +1,80 @@
+"""Load, lookup and compaction time of the Octave calibration database versus its size.
+
+A synthetic database is built in the format of calibration_db.json, with a few LO/IF
+modes calibrated many times. The lookup of the latest calibration by scanning the
+JSON tables is compared to the indexes of QM_caldb.CalibrationDB.
+
+Run:  python benchmarks/bench_caldb.py"""
+import json
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from QM_caldb import CalibrationDB
+
+
+def cal(i):
+    return {"temperature": 40. + i % 7, "timestamp": 1.7e9 + i, "method": "auto"}
+
+
+def make_db(calibrations, n_lo=20, n_if=5):
+    """Database of n_lo LO modes with n_if IF each, calibrated until it holds the given number of entries."""
+    db = {"modes": {"1": {"octave_name": "oct1", "octave_channel": 1}, "2": {"octave_name": "oct1", "octave_channel": 2}},
+          "lo_modes": {}, "lo_cal": {}, "if_modes": {}, "if_cal": {}}
+    for lo in range(1, n_lo + 1):
+        db["lo_modes"][str(lo)] = {"mode_id": 1 + lo % 2, "lo_freq": 4e9 + lo * 1e7, "gain": 0., "latest": -1}
+        for k in range(n_if):
+            if_id = (lo - 1) * n_if + k + 1
+            db["if_modes"][str(if_id)] = {"lo_mode_id": lo, "if_freq": -5e7 + k * 2e7, "latest": -1}
+    i = 0
+    while i < calibrations:
+        for lo_id, lo_mode in db["lo_modes"].items():
+            i += 1
+            db["lo_cal"][str(i)] = dict(cal(i), i0=0., q0=0., dc_gain=0., dc_phase=0.)
+            lo_mode["latest"] = i
+        for if_mode in db["if_modes"].values():
+            i += 1
+            db["if_cal"][str(i)] = dict(cal(i), gain=0., phase=0.)
+            if_mode["latest"] = i
+    return db
+
+
+def scan(db, octave, channel, lo, gain, if_freq):
+    for lo_mode_id, lo_mode in db["lo_modes"].items():
+        mode = db["modes"][str(lo_mode["mode_id"])]
+        if (mode["octave_name"], mode["octave_channel"], round(lo_mode["lo_freq"]), lo_mode["gain"]) == (octave, channel, lo, gain):
+            for if_mode in db["if_modes"].values():
+                if str(if_mode["lo_mode_id"]) == lo_mode_id and round(if_mode["if_freq"]) == if_freq:
+                    return db["if_cal"][str(if_mode["latest"])]
+    return None
+
+
+if __name__ == "__main__":
+    print(f"{'entries':>8s} {'file MB':>8s} {'load ms':>8s} {'scan us':>8s} {'index us':>9s} "
+          f"{'compact ms':>11s} {'after MB':>9s} {'reload ms':>10s}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "calibration_db.json")
+        for entries in (1000, 3000, 10000, 30000, 100000):
+            with open(path, "w") as f:
+                json.dump(make_db(entries), f, indent=4)
+            size = os.path.getsize(path) / 1e6
+            t = time.perf_counter()
+            db = CalibrationDB(path)
+            load = time.perf_counter() - t
+            key = ("oct1", 1, round(4e9 + 19 * 1e7), 0., round(3e7))
+            assert scan(db.tables, *key) is db.if_calibration(*key)
+            n = 200
+            t_scan = timeit.timeit(lambda: scan(db.tables, *key), number=n) / n
+            t_index = timeit.timeit(lambda: db.if_calibration(*key), number=n) / n
+            t = time.perf_counter()
+            db.compact()
+            db.save()
+            compact = time.perf_counter() - t
+            t = time.perf_counter()
+            CalibrationDB(path)
+            reload = time.perf_counter() - t
+            print(f"{entries:8d} {size:8.2f} {load*1e3:8.1f} {t_scan*1e6:8.1f} {t_index*1e6:9.2f} "
+                  f"{compact*1e3:11.1f} {os.path.getsize(path)/1e6:9.3f} {reload*1e3:10.2f}")
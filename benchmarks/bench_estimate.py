@@ -0,0 +1,66 @@
+"""Accuracy of QM_estimate.DurationEstimator before and after learning from past runs.
+
+Run times of the LifeTime, DephasingTime and RabiChevrons sweeps (with random n_avg) are drawn
+from a hidden model with a load overhead, per-pass and per-instruction latencies and 2% noise.
+The relative error of the estimator is printed as observations accumulate, next to the
+hand-written notebook formulas.
+
+Run:  python benchmarks/bench_estimate.py"""
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from QM_estimate import DurationEstimator, play, measure, wait, reset
+from QM_sweep import Axis, Sweep
+
+rng = np.random.default_rng(0)
+config = {
+    "elements": {
+        "qubit": {"operations": {"pi": "square_pi_pulse", "x180": "x180_pulse", "x90": "x90_pulse"}},
+        "resonator": {"operations": {"readout": "readout_pulse"}, "time_of_flight": 256, "smearing": 0},
+    },
+    "pulses": {"square_pi_pulse": {"length": 112}, "x180_pulse": {"length": 248}, "x90_pulse": {"length": 248},
+               "readout_pulse": {"length": 2000}},
+}
+readout = [measure("resonator", "readout"), reset("qubit", "pi", 108)]
+
+
+def experiments(n_avg):
+    durations = np.arange(5000 // 4, 150000 // 4, 5000 // 4)
+    t1 = Sweep(Axis("t", durations), n_avg=n_avg)
+    yield "LifeTime", t1, [play("qubit", "x180"), wait("t")] + readout, sum(durations * 4e-9 + 2e-6) * n_avg
+    durations = np.arange(100 // 4, 50000 // 4, 4000 // 4)
+    phase = np.linspace(0, 1, 20)
+    t2 = Sweep(Axis("t", durations), Axis("phi", phase), n_avg=n_avg)
+    yield ("DephasingTime", t2, [play("qubit", "x90"), wait("t"), play("qubit", "x90")] + readout,
+           sum(durations * 4e-9 + 2e-6) * len(phase) * n_avg)
+    durations = np.arange(1, 8000 // 4, 8 // 4)
+    detuning = np.arange(-5e6, 5e6, 50e3)
+    chevron = Sweep(Axis("fs", detuning, dtype=int), Axis("t", durations), n_avg=max(n_avg // 200, 1))
+    yield ("RabiChevrons", chevron, [play("qubit", "pi", "t")] + readout,
+           sum(durations * 4e-9 + 2e-6) * len(detuning) * chevron.n_avg)
+
+
+def actual(estimator, sweep, steps):
+    """Hidden model of the OPX: 3 s of overhead, 1.4 us per pass and 60 ns per instruction."""
+    f = estimator.features(sweep, steps)
+    return (3. + f["time"] + 1.4e-6 * f["passes"] + 60e-9 * f["instructions"]) * (1 + 0.02 * rng.standard_normal())
+
+
+if __name__ == "__main__":
+    estimator = DurationEstimator(config, path=None)
+    print(f"{'observations':>12s} {'LifeTime':>10s} {'Dephasing':>10s} {'Chevrons':>10s}   relative error of the estimate")
+    for n in range(31):
+        if n in (0, 1, 3, 10, 30):
+            errors = []
+            formula = []
+            for name, sweep, steps, hand in experiments(2000):
+                truth = actual(estimator, sweep, steps)
+                errors.append(estimator.estimate(sweep, steps) / truth - 1)
+                formula.append(hand / truth - 1)
+            if n == 0:
+                print(f"{'formula':>12s} " + " ".join(f"{e:10.1%}" for e in formula))
+            print(f"{n:12d} " + " ".join(f"{e:10.1%}" for e in errors))
+        name, sweep, steps, hand = list(experiments(int(rng.integers(100, 10000))))[n % 3]
+        estimator.observe(sweep, steps, actual(estimator, sweep, steps))
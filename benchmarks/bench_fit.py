@@ -0,0 +1,78 @@
+"""Batched fits of QM_fit versus a row-by-row scipy curve_fit loop.
+
+Synthetic datasets with the shapes of the notebooks: phase sweeps as in DephasingTime,
+T1 decays as in LifeTime and a Rabi chevron as in RabiChevrons (200 detunings x 1000
+durations). Times and the median relative difference of the fitted parameters are printed.
+
+Run:  python benchmarks/bench_fit.py"""
+import os
+import sys
+import time
+import numpy as np
+from scipy.optimize import curve_fit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import QM_fit
+
+rng = np.random.default_rng(1)
+
+
+def curve_fit_rows(fun, x, y, p0):
+    """Row-by-row loop, p0(x, row, previous popt) gives the starting values of each row."""
+    popt, previous = [], None
+    for row in y:
+        try:
+            previous = curve_fit(fun, x, row, p0(x, row, previous))[0]
+            popt.append(previous)
+        except RuntimeError:
+            popt.append(np.full(len(previous), np.nan))
+    return np.array(popt)
+
+
+def fft_seed(t, row, previous):
+    """Starting values of a damped cosine from the FFT of one row."""
+    spectrum = np.abs(np.fft.rfft(row - row.mean(), 4 * len(t)))
+    f = np.fft.rfftfreq(4 * len(t), t[1] - t[0])[1 + np.argmax(spectrum[1:])]
+    return (2 * row.std(), t[-1] - t[0], f, 0., row.mean())
+
+
+def compare(name, fun, x, y, p0, batched, columns):
+    t0 = time.perf_counter()
+    with np.errstate(all="ignore"):
+        ref = curve_fit_rows(fun, x, y, p0)
+    t1 = time.perf_counter()
+    popt, perr = batched(x, y)
+    t2 = time.perf_counter()
+    # Rows where either fit locked on noise are left out of the comparison
+    ok = np.all(np.isfinite(ref[:, columns]), axis=1) & (np.abs(popt[:, 0]) > 3 * perr[:, 0])
+    diff = np.median(np.abs(popt[ok][:, columns] - ref[ok][:, columns]) / np.abs(ref[ok][:, columns]), axis=0)
+    print(f"{name:24s} {y.shape[0]:5d} x {y.shape[1]:<5d} {(t1-t0)*1e3:10.1f} {(t2-t1)*1e3:10.1f} "
+          f"{(t1-t0)/(t2-t1):8.1f}   {np.array2string(diff, precision=1)}")
+
+
+if __name__ == "__main__":
+    print(f"{'fit':24s} {'rows x points':>13s} {'loop ms':>10s} {'batched ms':>10s} {'speedup':>8s}   rel. diff")
+    for rows in (13, 1000):
+        phi = np.linspace(0, 1, 20)
+        a = 0.4 * np.exp(-np.linspace(0, 5, rows))
+        y = QM_fit.cosine_phase(phi, a[:, None], 0.02, 0.3) + 0.02 * rng.standard_normal((rows, len(phi)))
+        # Each row starts from the previous fit, as in DephasingTime
+        compare("phase (DephasingTime)", QM_fit.cosine_phase, phi, y,
+                lambda x, row, previous: (0.4, 0, 0.1) if previous is None else previous, QM_fit.fit_phase, [0])
+
+    for rows in (1, 200):
+        t = np.arange(5000 // 4, 150000 // 4, 5000 // 4) * 4e-3
+        tau = rng.uniform(15, 40, rows)
+        y = QM_fit.exp_decay(t, 0.7, tau[:, None], -0.35) + 0.01 * rng.standard_normal((rows, len(t)))
+        compare("T1 (LifeTime)", QM_fit.exp_decay, t, y, lambda x, row, previous: (0.7, 25, -0.35),
+                QM_fit.fit_exp, [0, 1, 2])
+
+    t = np.arange(1, 8000 // 4, 8 // 4) * 4e-3
+    detuning = np.arange(-5, 5, 0.05)
+    f = np.sqrt(1.2 ** 2 + (detuning - 0.3) ** 2)
+    amp = 0.5 * 1.2 ** 2 / f ** 2
+    y = QM_fit.damped_cosine(t, amp[:, None], 3., f[:, None], 0., 0.) + 0.05 * rng.standard_normal((len(f), len(t)))
+    compare("Rabi rows (RabiChevrons)", QM_fit.damped_cosine, t, y, fft_seed, QM_fit.fit_damped_cosine, [2])
+    t0 = time.perf_counter()
+    f_rabi, center, popt, perr = QM_fit.fit_chevron(t, detuning, y)
+    print(f"fit_chevron: f_rabi {f_rabi:.3f} (1.2), center {center:.3f} (0.3) in {(time.perf_counter()-t0)*1e3:.0f} ms")
@@ -0,0 +1,53 @@
+"""Adaptive refinement of a Rabi chevron versus the dense RabiChevrons grid.
+
+A chevron (Rabi frequency 1.2 MHz, 3 us decay) is simulated on the grid of RabiChevrons.ipynb,
+200 detunings x 1000 durations with 50 single shots per point. The dense scan is compared to
+QM_refine.refine for a few measurement budgets: shots used, number of jobs, RMS error of the
+map against the noiseless chevron, and Rabi frequency and center from QM_fit.fit_chevron.
+
+Run:  python benchmarks/bench_refine.py"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import QM_fit
+import QM_refine
+
+rng = np.random.default_rng(0)
+n_avg = 50
+durations = np.arange(1, 8000 // 4, 8 // 4)
+detuning = np.arange(-5e6, 5e6, 50e3)
+f_rabi, center, decay = 1.2e6, 0.3e6, 3e-6
+
+
+def expectation(detuning, durations):
+    t = durations * 4e-9
+    f = np.sqrt(f_rabi ** 2 + (detuning - center) ** 2)
+    return 0.5 - f_rabi ** 2 / f ** 2 / 2 * (1 - np.exp(-t / decay) * np.cos(2 * np.pi * f * t))
+
+
+def measure(detuning, durations):
+    jobs.append(len(detuning))
+    return rng.binomial(n_avg, expectation(detuning, durations) + 0.5) / n_avg - 0.5
+
+
+def report(name, Sz, shots):
+    truth = expectation(detuning[:, None], durations[None, :])
+    rms = np.sqrt(np.mean((Sz - truth) ** 2))
+    f, c, popt, perr = QM_fit.fit_chevron(durations * 4e-3, detuning / 1e6, Sz)
+    print(f"{name:22s} {shots/1e6:8.2f} {len(jobs):5d} {rms:8.4f} {f:9.3f} {c:9.3f}")
+
+
+if __name__ == "__main__":
+    print(f"{'':22s} {'Mshots':>8s} {'jobs':>5s} {'rms':>8s} {'f_rabi':>9s} {'center':>9s}   (MHz, true 1.200 0.300)")
+    jobs = []
+    D, T = np.meshgrid(detuning, durations, indexing="ij")
+    report("dense", measure(D.ravel(), T.ravel()).reshape(D.shape), D.size * n_avg)
+    for max_fraction in (0.1, 0.2, 0.3):
+        jobs = []
+        t0 = time.perf_counter()
+        grid = QM_refine.refine(measure, detuning, durations, noise=0.5 / np.sqrt(n_avg), max_fraction=max_fraction)
+        Sz = grid.map()
+        report(f"adaptive {max_fraction:.0%} ({time.perf_counter()-t0:.1f} s)", Sz, grid.measured.sum() * n_avg)
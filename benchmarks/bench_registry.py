@@ -0,0 +1,40 @@
+"""Cost of the job lookups done by QueueMonitor.parse_queue versus registry size.
+
+Each tick looks up every pending job and the running job. The former linear scan
+of QueueMonitor.joblist is compared to QM_registry.JobRegistry.
+
+Run:  python benchmarks/bench_registry.py [queue length]"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from QM_registry import JobRegistry
+
+
+def linear_search(joblist, job_id, qm_id, status):
+    for job in joblist:
+        if job_id == job['id'] and qm_id == job['qm_id'] and status == job['status']:
+            return job
+    return None
+
+
+def make_jobs(size):
+    return [{"status": "pending", "time": float(i), "user": f"student{i%20}", "id": f"job-{i}", "qm_id": "qm-1"}
+            for i in range(size)]
+
+
+if __name__ == "__main__":
+    queue_length = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print(f"{'registry size':>14s} {'list scan':>12s} {'JobRegistry':>12s}   per tick of {queue_length} lookups")
+    for size in (100, 1000, 10000, 50000):
+        jobs = make_jobs(size)
+        registry = JobRegistry(capacity=size)
+        for job in jobs:
+            registry.add(job)
+        # The queue holds the most recent registrations, the worst case for the scan
+        queue = [job["id"] for job in jobs[-queue_length:]]
+        n = max(1, 20000 // size)
+        t_list = timeit.timeit(lambda: [linear_search(jobs, i, "qm-1", "pending") for i in queue], number=n) / n
+        t_reg = timeit.timeit(lambda: [registry.get(i, "qm-1", "pending") for i in queue], number=1000) / 1000
+        print(f"{size:14d} {1e3*t_list:10.3f}ms {1e3*t_reg:10.3f}ms")
@@ -0,0 +1,36 @@
+"""Startup cost of `import QM` / `import QMM` in a fresh interpreter.
+
+Run from anywhere:  python benchmarks/bench_startup.py [repeats]
+The import must not connect to the QM router, the script checks it."""
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = """
+import time
+t0 = time.perf_counter()
+import {module}
+dt = time.perf_counter() - t0
+import QM_session
+assert not QM_session.session.connected, "import connected to the router"
+print(dt)
+"""
+
+
+def time_import(module, repeats):
+    times = []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c", SNIPPET.format(module=module)], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.split()[-1]))
+    return times
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    for module in ("QM_session", "QM", "QMM"):
+        times = time_import(module, repeats)
+        print(f"import {module:10s} median {1e3*statistics.median(times):7.1f} ms   max {1e3*max(times):7.1f} ms")
@@ -3,7 +3,7 @@ QUA-Config supporting OPX+ & Octave
 """
 
 from qualang_tools.units import unit
-import numpy as np
+from QM_waveforms import gaussian
 
 #######################
 # AUXILIARY FUNCTIONS #
@@ -31,7 +31,6 @@ short_readout_len = 80 * u.ns
 time_of_flight = 24
 
 # Gaussian pulse
-gaussian = lambda amplitude, length, sigma : amplitude * np.exp(-(np.arange(length)-length/2)** 2/(2*sigma**2)) 
 gaussian_wf = gaussian(0.1, 200, 40)
 
 #############################################
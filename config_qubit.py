@@ -4,6 +4,7 @@ Config for basic transmon manipulation and readout
 
 from qualang_tools.units import unit
 import numpy as np
+from QM_waveforms import gaussian
 u = unit(coerce_to_integer=True)
 
 #############################################
@@ -23,22 +24,21 @@ saturation_amp = 0.1
 square_pi_len = 112 * u.ns
 square_pi_amp = 0.125
 # Gaussian pulses
-gaussian_pulse = lambda amplitude, length, sigma : amplitude * np.exp(-(np.arange(length)-length/2)** 2/(2*sigma**2))
 rot_180_len = 248
 rot_180_sigma = rot_180_len / 5
 rot_180_amp = 0.125
-x180_I_wf = gaussian_pulse(rot_180_amp, rot_180_len, rot_180_sigma)
+x180_I_wf = gaussian(rot_180_amp, rot_180_len, rot_180_sigma)
 x180_Q_wf = np.zeros(rot_180_len)
 y180_I_wf = np.zeros(rot_180_len)
-y180_Q_wf = gaussian_pulse(rot_180_amp, rot_180_len, rot_180_sigma)
+y180_Q_wf = gaussian(rot_180_amp, rot_180_len, rot_180_sigma)
 
 rot_90_len = rot_180_len
 rot_90_sigma = rot_180_sigma
 rot_90_amp = rot_180_amp / 2
-x90_I_wf = gaussian_pulse(rot_90_amp, rot_90_len, rot_90_sigma)
+x90_I_wf = gaussian(rot_90_amp, rot_90_len, rot_90_sigma)
 x90_Q_wf = np.zeros(rot_90_len)
 y90_I_wf = np.zeros(rot_90_len)
-y90_Q_wf = gaussian_pulse(rot_90_amp, rot_90_len, rot_90_sigma)
+y90_Q_wf = gaussian(rot_90_amp, rot_90_len, rot_90_sigma)
 
 #############################################
 #                Resonators                 #